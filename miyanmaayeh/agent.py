@@ -9,11 +9,16 @@ from miyanmaayeh.history import AgentHistory, MarketHistory
 class Agent:
     GROUP = "Agent"
 
-    def __init__(self, confidence_level, production, inventory, income, cash, activation_time=0):
+    def __init__(self, confidence_level, production, inventory, income, cash, activation_time=0, seed=None, weight=1):
         self.confidence_level = confidence_level
-        self.noise_generator = np.random.default_rng(int(time.time() * 10000))
+        # number of participants this agent stands for; a cohort agent holds their summed balances, income and production
+        self.weight = weight
+        self.noise_seed = int(time.time() * 10000) if seed is None else seed
+        self._noise_generator = None
         self.ng_std = (1 - self.confidence_level) / 6
         self.production = production
+        self.population = None
+        self.slot = None
         self.inventory = inventory
         self.income = income
         self.cash = cash
@@ -21,13 +26,43 @@ class Agent:
         self.activation_time = activation_time
         self.history = []
 
-    def tick(self, iteration):
-        if iteration >= self.activation_time:
-            self.is_active = True
-
-        if self.is_active:
-            self.cash += self.income
-            self.inventory += self.production
+    @property
+    def noise_generator(self):
+        # generators are only built for agents that actually perceive the market
+        if self._noise_generator is None:
+            self._noise_generator = np.random.default_rng(self.noise_seed)
+        return self._noise_generator
+
+    def bind(self, population, slot):
+        # from here on cash and inventory live in the population arrays
+        self.population = population
+        self.slot = slot
+
+    @property
+    def cash(self):
+        if self.population is None:
+            return self._cash
+        return self.population.cash[self.slot]
+
+    @cash.setter
+    def cash(self, value):
+        if self.population is None:
+            self._cash = value
+        else:
+            self.population.cash[self.slot] = value
+
+    @property
+    def inventory(self):
+        if self.population is None:
+            return self._inventory
+        return self.population.inventory[self.slot]
+
+    @inventory.setter
+    def inventory(self, value):
+        if self.population is None:
+            self._inventory = value
+        else:
+            self.population.inventory[self.slot] = value
 
     def apply_perception_on_market_prices(self, market_price_history):
         sz = len(market_price_history)
@@ -0,0 +1,76 @@
+from copy import copy
+from time import perf_counter
+
+import numpy as np
+
+from miyanmaayeh.runner import Runner
+
+
+def _run_statistics(config, ticks):
+    runner = Runner(config=config)
+    start = perf_counter()
+    runner.run(ticks)
+    seconds = perf_counter() - start
+    runner.close()
+
+    population = runner.population
+    return {
+        "seconds": seconds,
+        "simulated_agents": len(runner.agents),
+        "participants": int(population.weight[: population.size].sum()),
+        "mean_price": runner.get_series("price").mean(),
+        "final_price": runner.get_series("price")[-1],
+        "mean_volume": runner.get_series("volume").mean(),
+        "market_profit": runner.get_series("market_profit").sum(),
+        **{f"wealth.{group}": runner.get_wealth_series(group)[-1] for group in runner.groups},
+    }
+
+
+class CohortReport:
+    def __init__(self, full, cohort) -> None:
+        # replica means of every statistic, for the full population and the cohort run
+        self.full = full
+        self.cohort = cohort
+
+    @property
+    def speedup(self):
+        return self.full["seconds"] / max(self.cohort["seconds"], 1e-12)
+
+    @property
+    def deviation(self):
+        # relative deviation of the cohort result from the full-population result
+        names = [name for name in self.full if name not in ("seconds", "simulated_agents", "participants")]
+        return {name: abs(self.cohort[name] - self.full[name]) / max(abs(self.full[name]), 1e-12) for name in names}
+
+    def __str__(self):
+        lines = [
+            f"{self.full['simulated_agents']:.0f} agents -> {self.cohort['simulated_agents']:.0f} cohorts "
+            f"for {self.cohort['participants']:.0f} participants, {self.speedup:.1f}x faster"
+        ]
+        for name, error in self.deviation.items():
+            lines.append(f"{name}: {self.full[name]:.4f} vs {self.cohort[name]:.4f} ({100 * error:.2f}%)")
+        return "\n".join(lines)
+
+
+def cohort_deviation(config, ticks, replicas=1):
+    # runs config with and without its "cohorts" entry on the same seeds and compares the replica means
+    full_config = copy(config)
+    full_config.pop("cohorts", None)
+    full_config["plot_dir"] = None
+
+    cohort_config = copy(config)
+    cohort_config["plot_dir"] = None
+
+    full, cohort = [], []
+    for replica in range(replicas):
+        if config.get("seed", None) is not None:
+            full_config["seed"] = cohort_config["seed"] = config["seed"] + replica
+
+        full.append(_run_statistics(full_config, ticks))
+        cohort.append(_run_statistics(cohort_config, ticks))
+
+    names = [name for name in full[0] if name in cohort[0]]
+    return CohortReport(
+        {name: np.mean([run[name] for run in full]) for name in names},
+        {name: np.mean([run[name] for run in cohort]) for name in names},
+    )
@@ -0,0 +1,82 @@
+import multiprocessing
+
+import numpy as np
+
+from miyanmaayeh.history import RunSummary
+from miyanmaayeh.runner import Runner
+from miyanmaayeh.utils import get_steady_state, get_trendline
+
+
+def summarize_run(runner, label=None):
+    prices = np.array(runner.get_series("price"))
+    ticks = runner.get_ticks()
+
+    steady_idx, steady_prices = get_steady_state(prices)
+    trendline = get_trendline(ticks[steady_idx], steady_prices)
+
+    wealth = {group: np.array(runner.get_wealth_series(group)) for group in runner.groups}
+
+    return RunSummary(
+        prices=prices,
+        ticks=ticks,
+        steady_start=steady_idx[0],
+        trendline=trendline,
+        wealth=wealth,
+        market_profit=runner.get_series("market_profit").sum(),
+        label=label,
+    )
+
+
+class EnsembleRunner:
+    # Reduces every finished run to a summary and drops the runner, so memory does not grow with replicas
+    def __init__(self, ticks, reducer=summarize_run) -> None:
+        self.ticks = ticks
+        self.reducer = reducer
+        self.summaries = []
+
+    def run(self, config, replicas=1, label=None):
+        summaries = []
+        for _ in range(replicas):
+            runner = Runner(config=config)
+            runner.run(self.ticks)
+            summaries.append(self.reducer(runner, label))
+            runner.close()
+            del runner
+
+        self.summaries.extend(summaries)
+        return summaries
+
+
+_warm_start = None
+
+
+def _run_fork(market_options):
+    snapshot, ticks, reducer = _warm_start
+    # the forked process already owns a copy-on-write image of the snapshot
+    runner = snapshot.fork(market_options=market_options, copy=False)
+    runner.run(ticks)
+    summary = reducer(runner, market_options)
+    runner.close()
+    return summary
+
+
+def run_forks(snapshot, market_options_list, ticks, reducer=summarize_run, processes=None):
+    global _warm_start
+
+    if processes == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        summaries = []
+        for market_options in market_options_list:
+            runner = snapshot.fork(market_options=market_options)
+            runner.run(ticks)
+            summaries.append(reducer(runner, market_options))
+            runner.close()
+            del runner
+        return summaries
+
+    _warm_start = (snapshot, ticks, reducer)
+    try:
+        # one task per process: each branch consumes the snapshot image it was forked with
+        with multiprocessing.get_context("fork").Pool(processes=processes, maxtasksperchild=1) as pool:
+            return pool.map(_run_fork, market_options_list, chunksize=1)
+    finally:
+        _warm_start = None
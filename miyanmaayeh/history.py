@@ -1,5 +1,22 @@
+from collections import deque
+from copy import copy
+
+import numpy as np
+
+
 class RunHistory:
-    def __init__(self, volume, sell_actions, buy_actions, price, wealth, market_profit, demands=[], supplies=[]) -> None:
+    def __init__(
+        self,
+        volume,
+        sell_actions,
+        buy_actions,
+        price,
+        wealth,
+        market_profit,
+        demands=[],
+        supplies=[],
+        group_stats=None,
+    ) -> None:
         self.volume = volume  # p * q
         self.sell_action_count = sell_actions
         self.buy_action_count = buy_actions
@@ -8,18 +25,129 @@ class RunHistory:
         self.demands = demands
         self.supplies = supplies
         self.market_profit = market_profit
+        self.group_stats = group_stats  # metric -> group -> total, see Population.group_stats
 
 
 class MarketHistory:
-    def __init__(self, price_equilibrium, sell_actions, buy_actions, volume, profit) -> None:
+    def __init__(
+        self,
+        price_equilibrium,
+        sell_actions,
+        buy_actions,
+        volume,
+        profit,
+        price_error_bound=None,
+        price_error=None,
+        fill_count=0,
+    ) -> None:
         self.price_equilibrium = price_equilibrium
         self.sell_action_count = sell_actions
         self.buy_action_count = buy_actions
         self.volume = volume
         self.profit = profit
+        self.price_error_bound = price_error_bound  # only set by approximate (binned) clearing
+        self.price_error = price_error
+        self.fill_count = fill_count
 
 
 class AgentHistory:
     def __init__(self, action_type, bid) -> None:
         self.type = action_type
         self.bid = bid
+
+
+class RunSummary:
+    def __init__(self, prices, steady_start, trendline, wealth, market_profit, label=None, ticks=None) -> None:
+        self.prices = prices
+        self.ticks = np.arange(len(prices)) if ticks is None else ticks  # tick of every price, uneven for multi-resolution runs
+        self.steady_start = steady_start  # index into prices
+        self.trendline = trendline  # np.poly1d fitted on (ticks, prices) from steady_start on
+        self.wealth = wealth  # group -> welfare series
+        self.market_profit = market_profit
+        self.label = label
+
+    @property
+    def steady_ticks(self):
+        return self.ticks[self.steady_start :]
+
+
+class HistoryBar:
+    # OHLC price and summed flows over `ticks` consecutive ticks starting at `start`
+    def __init__(self, start, history) -> None:
+        self.start = start
+        self.ticks = 1
+        self.open = self.high = self.low = self.close = history.price
+        self.volume = history.volume
+        self.market_profit = history.market_profit
+        self.sell_action_count = history.sell_action_count
+        self.buy_action_count = history.buy_action_count
+        self.wealth = history.wealth  # group welfare at the close
+
+    @property
+    def price(self):
+        return self.close
+
+    def merge(self, other):
+        self.ticks += other.ticks
+        self.high = max(self.high, other.high)
+        self.low = min(self.low, other.low)
+        self.close = other.close
+        self.volume += other.volume
+        self.market_profit += other.market_profit
+        self.sell_action_count += other.sell_action_count
+        self.buy_action_count += other.buy_action_count
+        self.wealth = other.wealth
+        return self
+
+
+class MultiResolutionHistory:
+    # Keeps the last `recent` ticks as RunHistory; older ticks roll up into levels of bars spanning
+    # factor**k ticks, at most `level_size` bars per level, so memory grows with log(ticks)
+    def __init__(self, recent=1000, factor=4, level_size=256) -> None:
+        assert level_size >= factor
+        self.recent_size = recent
+        self.factor = factor
+        self.level_size = level_size
+        self.recent = deque()
+        self.levels = []
+        self.ticks = 0
+
+    def __len__(self):
+        return self.ticks
+
+    def append(self, history):
+        self.recent.append((self.ticks, history))
+        self.ticks += 1
+
+        if len(self.recent) > self.recent_size:
+            start, oldest = self.recent.popleft()
+            self._push(0, HistoryBar(start, oldest))
+
+    def _push(self, level, bar):
+        if level == len(self.levels):
+            self.levels.append(deque())
+
+        bars = self.levels[level]
+        bars.append(bar)
+        if len(bars) > self.level_size:
+            merged = bars.popleft()
+            for _ in range(self.factor - 1):
+                merged.merge(bars.popleft())
+            self._push(level + 1, merged)
+
+    @property
+    def coarsest_span(self):
+        return self.factor ** (len(self.levels) - 1) if len(self.levels) > 0 else 1
+
+    def bars(self, span=1):
+        # oldest first; consecutive bars are merged until each covers at least `span` ticks
+        bars = [bar for level in reversed(self.levels) for bar in level]
+        bars += [HistoryBar(start, history) for start, history in self.recent]
+
+        result = []
+        for bar in bars:
+            if len(result) > 0 and result[-1].ticks < span:
+                result[-1].merge(bar)
+            else:
+                result.append(copy(bar))
+        return result
@@ -0,0 +1,95 @@
+import numpy as np
+
+# agent ids are population slots, -1 for agents outside a population
+FILL_DTYPE = np.dtype(
+    [("tick", "<i4"), ("buyer", "<i4"), ("seller", "<i4"), ("quantity", "<f8"), ("buyer_price", "<f8"), ("seller_price", "<f8")]
+)
+
+
+class FillLedger:
+    # Append-only record of every fill. Fills go into a fixed-size chunk; full chunks are kept in memory or,
+    # with a path, appended to one raw file of FILL_DTYPE records so memory stays bounded.
+    def __init__(self, path=None, chunk_size=65536) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.chunk = np.empty(chunk_size, dtype=FILL_DTYPE)
+        self.chunk_count = 0
+        self.chunks = []
+        self.spilled = 0
+        self.file = None if path is None else open(path, "wb")
+
+    def __len__(self):
+        return self.spilled + sum(len(chunk) for chunk in self.chunks) + self.chunk_count
+
+    def _spill(self):
+        if self.file is not None:
+            self.chunk[: self.chunk_count].tofile(self.file)
+            self.spilled += self.chunk_count
+        else:
+            self.chunks.append(self.chunk[: self.chunk_count])
+            self.chunk = np.empty(self.chunk_size, dtype=FILL_DTYPE)
+        self.chunk_count = 0
+
+    def record(self, tick, buyers, sellers, quantities, buyer_price, seller_price):
+        start = 0
+        while start < len(quantities):
+            if self.chunk_count == self.chunk_size:
+                self._spill()
+
+            count = min(len(quantities) - start, self.chunk_size - self.chunk_count)
+            rows = self.chunk[self.chunk_count : self.chunk_count + count]
+            rows["tick"] = tick
+            rows["buyer"] = buyers[start : start + count]
+            rows["seller"] = sellers[start : start + count]
+            rows["quantity"] = quantities[start : start + count]
+            rows["buyer_price"] = buyer_price
+            rows["seller_price"] = seller_price
+
+            self.chunk_count += count
+            start += count
+
+    def flush(self):
+        if self.file is not None:
+            self._spill()
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def _parts(self):
+        # spilled records as a read-only memmap, then the in-memory chunks, all in append order
+        parts = []
+        if self.spilled > 0:
+            if self.file is not None:
+                self.file.flush()
+            parts.append(np.memmap(self.path, dtype=FILL_DTYPE, mode="r", shape=(self.spilled,)))
+        parts += self.chunks
+        parts.append(self.chunk[: self.chunk_count])
+        return parts
+
+    def fills(self):
+        return np.concatenate(self._parts())
+
+    def by_agent(self, agent_id):
+        # scanned a chunk at a time, so a spilled ledger is never loaded whole
+        matches = [self.chunk[:0]]
+        for part in self._parts():
+            for start in range(0, len(part), self.chunk_size):
+                block = part[start : start + self.chunk_size]
+                matches.append(block[(block["buyer"] == agent_id) | (block["seller"] == agent_id)])
+        return np.concatenate(matches)
+
+    def by_ticks(self, start, stop):
+        # fills are appended in tick order, so a tick range is a contiguous slice of every part
+        matches = []
+        for part in self._parts():
+            ticks = part["tick"]
+            matches.append(part[np.searchsorted(ticks, start, side="left") : np.searchsorted(ticks, stop, side="left")])
+        return np.concatenate(matches)
+
+
+def read_fill_ledger(path):
+    return np.fromfile(path, dtype=FILL_DTYPE)
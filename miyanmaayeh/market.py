@@ -1,23 +1,48 @@
-from copy import deepcopy
+import numpy as np
 
 from miyanmaayeh.action import ActionType, AgentAction, MarketAction
 from miyanmaayeh.history import MarketHistory
+from miyanmaayeh.order_book import BinnedOrderBook, OrderBook
 
 
 class Market:
-    def __init__(self, initial_price=1000, *args, **kwargs) -> None:
+    def __init__(self, initial_price=1000, clearing_buckets=None, report_clearing_error=False, *args, **kwargs) -> None:
         self.initial_price = initial_price
         self.history = []
         self.actions = []
+        self.order_book = None
+        # clearing_buckets switches to approximate clearing on a bid histogram with that many buckets
+        self.clearing_buckets = clearing_buckets
+        self.report_clearing_error = report_clearing_error
+        # an optional FillLedger that every fill is appended to
+        self.ledger = None
 
     def new_tick(self):
         self.actions = []
+        self.order_book = None
 
     def get_history(self):
         return self.history[-10:]
 
     def add_action(self, action: MarketAction):
         self.actions.append(action)
+        self.order_book = None
+
+    def get_order_book(self) -> OrderBook:
+        # built once per tick and shared by clearing, allocation and snapshots
+        if self.order_book is None:
+            if self.clearing_buckets is None:
+                self.order_book = OrderBook(self.actions)
+            else:
+                self.order_book = BinnedOrderBook(self.actions, self.clearing_buckets)
+        return self.order_book
+
+    def calculate_exact_market_price(self):
+        order_book = self.order_book
+        self.order_book = OrderBook(self.actions)
+        price = self.calculate_market_price()
+        self.order_book = order_book
+        return price
 
     def calculate_buy_price(self, market_price):
         return market_price
@@ -26,21 +51,7 @@ class Market:
         return market_price
 
     def calculate_market_price_equilibrium(self):
-        sorted_actions = sorted(self.actions, key=lambda x: -x.bid if x.type == ActionType.Buy.value else x.bid)
-        qs = 0
-        qd = 0
-        best_q = 0
-        price_equilibrium = 0
-        for action in sorted_actions:
-            if action.type == ActionType.Buy.value:
-                qd += action.amount
-            elif action.type == ActionType.Sell.value:
-                qs += action.amount
-
-            if min(qs, qd) > best_q:
-                best_q = min(qs, qd)
-                price_equilibrium = action.bid
-
+        price_equilibrium = self.get_order_book().equilibrium_price()
         return max(1, price_equilibrium)
 
     def calculate_market_price(self):
@@ -50,80 +61,73 @@ class Market:
 
     def allocate_commodity(self):
         # apply allocation rule here
-        sell_actions = []
-        buy_actions = []
-
-        for action in self.actions:
-            new_action = MarketAction(action_type=action.type, amount=action.amount, bid=action.bid, agent=action.agent)
-            if action.type == ActionType.Buy.value:
-                buy_actions.append(new_action)
-            elif action.type == ActionType.Sell.value:
-                sell_actions.append(new_action)
-
-        sell_actions = sorted(sell_actions, key=lambda x: x.bid)
-        buy_actions = sorted(buy_actions, key=lambda x: -x.bid)
+        order_book = self.get_order_book()
 
         market_price = self.calculate_market_price()
-        market_q = 0
-        market_profit = 0
 
         buyer_price = self.calculate_sell_price(market_price)
         seller_price = self.calculate_buy_price(market_price)
 
-        history = MarketHistory(market_price, len(sell_actions), len(buy_actions), 0, 0)
-
-        sell_action_idx = 0
-        buy_action_idx = 0
+        history = MarketHistory(market_price, order_book.sell_count, order_book.buy_count, 0, 0)
+        if self.clearing_buckets is not None:
+            history.price_error_bound = order_book.price_error_bound
+            if self.report_clearing_error:
+                history.price_error = abs(market_price - self.calculate_exact_market_price())
 
-        while True:
-            if sell_action_idx >= len(sell_actions):
-                break
-            if buy_action_idx >= len(buy_actions):
-                break
-            if sell_actions[sell_action_idx].bid > buyer_price:
-                break
-            if buy_actions[buy_action_idx].bid < seller_price:
-                break
+        buy_idx, sell_idx, amounts = order_book.match(buyer_price, seller_price)
+        self.settle(order_book, buy_idx, sell_idx, amounts, buyer_price, seller_price)
+        if self.ledger is not None:
+            self.record_fills(order_book, buy_idx, sell_idx, amounts, buyer_price, seller_price)
 
-            amount = min(sell_actions[sell_action_idx].amount, buy_actions[buy_action_idx].amount)
-            market_q += amount
-            market_profit += amount * abs(seller_price - buyer_price)
+        market_q = amounts.sum()
+        history.fill_count = len(amounts)
+        history.volume = market_q
+        history.profit = market_q * abs(seller_price - buyer_price)
+        self.history.append(history)
 
+    def record_fills(self, order_book, buy_idx, sell_idx, amounts, buyer_price, seller_price):
+        if order_book.population is not None:
+            buyers = order_book.buy_slots[buy_idx]
+            sellers = order_book.sell_slots[sell_idx]
+        else:
+            buyers = [getattr(order_book.buy_actions[i].agent, "slot", None) for i in buy_idx]
+            sellers = [getattr(order_book.sell_actions[j].agent, "slot", None) for j in sell_idx]
+            buyers = [-1 if slot is None else slot for slot in buyers]
+            sellers = [-1 if slot is None else slot for slot in sellers]
+
+        self.ledger.record(len(self.history), buyers, sellers, amounts, buyer_price, seller_price)
+
+    def settle(self, order_book, buy_idx, sell_idx, amounts, buyer_price, seller_price):
+        if order_book.population is not None:
+            # every fill of the tick in one scatter-add: buyers +q at buyer_price, sellers -q at seller_price
+            slots = np.concatenate([order_book.buy_slots[buy_idx], order_book.sell_slots[sell_idx]])
+            quantities = np.concatenate([amounts, -amounts])
+            prices = np.concatenate([np.full(len(amounts), buyer_price), np.full(len(amounts), seller_price)])
+            order_book.population.settle(slots, quantities, prices)
+            return
+
+        for i, j, amount in zip(buy_idx, sell_idx, amounts):
             buyer_agent_action = AgentAction(
                 action_type=ActionType.Buy.value,
                 amount=amount,
                 price=buyer_price,
             )
-            buy_actions[buy_action_idx].agent.apply_action(buyer_agent_action)
+            order_book.buy_actions[i].agent.apply_action(buyer_agent_action)
 
             seller_agent_action = AgentAction(
                 action_type=ActionType.Sell.value,
                 amount=amount,
                 price=seller_price,
             )
-            sell_actions[sell_action_idx].agent.apply_action(seller_agent_action)
-
-            buy_actions[buy_action_idx].amount -= amount
-            sell_actions[sell_action_idx].amount -= amount
-
-            if buy_actions[buy_action_idx].amount >= sell_actions[sell_action_idx].amount:
-                sell_action_idx += 1
-            else:
-                buy_action_idx += 1
-
-        history.volume = market_q
-        history.profit = market_profit
-        self.history.append(history)
+            order_book.sell_actions[j].agent.apply_action(seller_agent_action)
 
 
 class MarketWithFriction(Market):
     EPS = 0.01
 
     def __init__(self, friction_rate, initial_price=1000, *args, **kwargs) -> None:
+        super().__init__(initial_price, *args, **kwargs)
         self.friction_rate = friction_rate
-        self.initial_price = initial_price
-        self.history = []
-        self.actions = []
 
     def calculate_buy_price(self, market_price):
         return market_price * (1 - self.friction_rate)
@@ -132,16 +136,9 @@ class MarketWithFriction(Market):
         return market_price
 
     def calculate_qs(self, market_price):
-        q_s, q_d = 0, 0
-        q_s_price = self.calculate_buy_price(market_price)
-        q_d_price = self.calculate_sell_price(market_price)
-
-        for action in self.actions:
-            if action.type == ActionType.Buy.value and action.bid >= q_d_price:
-                q_d += action.amount
-            elif action.type == ActionType.Sell.value and action.bid <= q_s_price:
-                q_s += action.amount
-
+        order_book = self.get_order_book()
+        q_s = order_book.quantity_supplied(self.calculate_buy_price(market_price))
+        q_d = order_book.quantity_demanded(self.calculate_sell_price(market_price))
         return q_s, q_d
 
     def calculate_market_price(self):
@@ -0,0 +1,153 @@
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+PREFIX = "miyanmaayeh_"
+
+COUNTERS = {
+    "ticks_total": "Ticks simulated",
+    "orders_total": "Buy and sell orders submitted",
+    "fills_total": "Fills settled",
+}
+
+GAUGES = {
+    "ticks_per_second": "Tick rate over the last sampling interval",
+    "active_agents": "Agents active in the last tick",
+    "orders_per_tick": "Orders submitted in the last tick",
+    "fills_per_tick": "Fills settled in the last tick",
+    "clearing_seconds": "Wall time of the last clearing step",
+    "market_price": "Last market price",
+    "rss_bytes": "Current resident set size of the process, NaN where /proc is unavailable",
+    "peak_rss_bytes": "Peak resident set size of the process",
+}
+
+
+def get_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return float("nan")
+
+
+def get_peak_rss_bytes():
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RunMetrics:
+    # record_tick only stores numbers; rates, RSS, the file and the HTTP endpoint are handled by a background thread
+    def __init__(self, path=None, port=None, interval=5.0, max_bytes=10 * 1024 * 1024, backups=3) -> None:
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self.counters = {name: 0 for name in COUNTERS}
+        self.gauges = {name: 0.0 for name in GAUGES}
+        self.exposition = ""
+
+        self._stop = threading.Event()
+        self._sampler = None
+        self._server = None
+        self._logger = None
+        self._last_sample = (time.time(), 0)
+
+    def record_tick(self, active_agents, orders, fills, clearing_seconds, market_price):
+        self.counters["ticks_total"] += 1
+        self.counters["orders_total"] += orders
+        self.counters["fills_total"] += fills
+        self.gauges["active_agents"] = active_agents
+        self.gauges["orders_per_tick"] = orders
+        self.gauges["fills_per_tick"] = fills
+        self.gauges["clearing_seconds"] = clearing_seconds
+        self.gauges["market_price"] = market_price
+
+    def record_ticks(self, ticks):
+        # ticks simulated elsewhere, e.g. in forked branches, reported once they are done
+        self.counters["ticks_total"] += ticks
+
+    def render(self):
+        lines = []
+        for kind, descriptions, values in (("counter", COUNTERS, self.counters), ("gauge", GAUGES, self.gauges)):
+            for name, description in descriptions.items():
+                lines += [f"# HELP {PREFIX}{name} {description}", f"# TYPE {PREFIX}{name} {kind}", f"{PREFIX}{name} {values[name]}"]
+        return "\n".join(lines) + "\n"
+
+    def sample(self):
+        now = time.time()
+        ticks = self.counters["ticks_total"]
+        last_time, last_ticks = self._last_sample
+        self.gauges["ticks_per_second"] = (ticks - last_ticks) / max(now - last_time, 1e-9)
+        self.gauges["rss_bytes"] = get_rss_bytes()
+        self.gauges["peak_rss_bytes"] = get_peak_rss_bytes()
+        self._last_sample = (now, ticks)
+
+        self.exposition = self.render()
+        if self._logger is not None:
+            self._logger.info(f"# {time.strftime('%Y-%m-%dT%H:%M:%S')}\n{self.exposition}")
+
+    def _run_sampler(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self._sampler is not None:
+            return self
+
+        if self.path is not None:
+            self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups))
+
+        if self.port is not None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.exposition.encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        self._stop.clear()
+        self._last_sample = (time.time(), self.counters["ticks_total"])
+        self.sample()
+        self._sampler = threading.Thread(target=self._run_sampler, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._sampler is None:
+            return
+
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        self.sample()
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                handler.close()
+                self._logger.removeHandler(handler)
+            self._logger = None
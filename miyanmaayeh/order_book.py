@@ -0,0 +1,199 @@
+import numpy as np
+
+from miyanmaayeh.action import ActionType
+
+
+def pair_fills(buy_cumulative, sell_cumulative):
+    # every fill is a segment between consecutive breakpoints of the two cumulative curves
+    total = min(buy_cumulative[-1], sell_cumulative[-1])
+    edges = np.unique(np.concatenate([[0], buy_cumulative, sell_cumulative]))
+    edges = edges[edges <= total]
+    amounts = np.diff(edges)
+    buy_idx = np.searchsorted(buy_cumulative, edges[:-1], side="right")
+    sell_idx = np.searchsorted(sell_cumulative, edges[:-1], side="right")
+    return buy_idx, sell_idx, amounts
+
+
+def downsample_curve(curve, points=None):
+    if points is None or len(curve) <= points:
+        return curve
+
+    idx = np.unique(np.linspace(0, len(curve) - 1, points).round().astype(int))
+    return curve[idx]
+
+
+class OrderBook:
+    def __init__(self, actions) -> None:
+        buy_actions = [action for action in actions if action.type == ActionType.Buy.value]
+        sell_actions = [action for action in actions if action.type == ActionType.Sell.value]
+
+        # stable sorts keep submission order between equal bids
+        buy_bids = np.array([action.bid for action in buy_actions], dtype=float)
+        buy_order = np.argsort(-buy_bids, kind="stable")
+        self.buy_actions = [buy_actions[i] for i in buy_order]
+        self.buy_bids = buy_bids[buy_order]
+        self.buy_amounts = np.array([action.amount for action in buy_actions], dtype=float)[buy_order]
+        self.buy_cumulative = np.cumsum(self.buy_amounts)
+
+        sell_bids = np.array([action.bid for action in sell_actions], dtype=float)
+        sell_order = np.argsort(sell_bids, kind="stable")
+        self.sell_actions = [sell_actions[i] for i in sell_order]
+        self.sell_bids = sell_bids[sell_order]
+        self.sell_amounts = np.array([action.amount for action in sell_actions], dtype=float)[sell_order]
+        self.sell_cumulative = np.cumsum(self.sell_amounts)
+
+        self._bind_population()
+
+    def _bind_population(self):
+        # slots let settlement scatter straight into the population arrays when all agents share one
+        self.population = None
+        self.buy_slots = None
+        self.sell_slots = None
+        self.buy_count = len(self.buy_actions)
+        self.sell_count = len(self.sell_actions)
+        agents = [action.agent for action in self.buy_actions + self.sell_actions]
+        population = getattr(agents[0], "population", None) if len(agents) > 0 else None
+        if population is not None and all(getattr(agent, "population", None) is population for agent in agents):
+            self.population = population
+            self.buy_slots = np.array([action.agent.slot for action in self.buy_actions], dtype=np.int64)
+            self.sell_slots = np.array([action.agent.slot for action in self.sell_actions], dtype=np.int64)
+            # an order of a cohort agent counts once per member
+            self.buy_count = int(population.weight[self.buy_slots].sum())
+            self.sell_count = int(population.weight[self.sell_slots].sum())
+
+    def quantity_demanded(self, price):
+        # buy orders with bid >= price
+        count = np.searchsorted(-self.buy_bids, -price, side="right")
+        return self.buy_cumulative[count - 1] if count > 0 else 0
+
+    def quantity_supplied(self, price):
+        # sell orders with bid <= price
+        count = np.searchsorted(self.sell_bids, price, side="right")
+        return self.sell_cumulative[count - 1] if count > 0 else 0
+
+    def equilibrium_price(self):
+        if len(self.buy_bids) == 0 or len(self.sell_bids) == 0:
+            return 0
+
+        total_demand = self.buy_cumulative[-1]
+        if total_demand <= 0:
+            return 0
+
+        # the first ask at which supply covers the whole demand, or the last ask if it never does
+        idx = np.searchsorted(self.sell_cumulative, total_demand, side="left")
+        return self.sell_bids[min(idx, len(self.sell_bids) - 1)]
+
+    def match(self, buyer_price, seller_price):
+        # price priority on both sides: bids at or above the seller price meet asks at or below the buyer price
+        buy_count = np.searchsorted(-self.buy_bids, -seller_price, side="right")
+        sell_count = np.searchsorted(self.sell_bids, buyer_price, side="right")
+        if buy_count == 0 or sell_count == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        return pair_fills(self.buy_cumulative[:buy_count], self.sell_cumulative[:sell_count])
+
+    def demand_curve(self, points=None):
+        curve = np.column_stack([self.buy_bids, self.buy_cumulative - self.buy_amounts])
+        return downsample_curve(curve, points)
+
+    def supply_curve(self, points=None):
+        curve = np.column_stack([self.sell_bids, self.sell_cumulative])
+        return downsample_curve(curve, points)
+
+
+class BinnedOrderBook(OrderBook):
+    # Approximate book: orders are bucketed by bid and treated as priced at their bucket's center.
+    # Built in O(n + buckets) without sorting; clearing prices are off by at most about one bucket width.
+    def __init__(self, actions, buckets) -> None:
+        self.buy_actions = [action for action in actions if action.type == ActionType.Buy.value]
+        self.sell_actions = [action for action in actions if action.type == ActionType.Sell.value]
+        self.buy_bids = np.array([action.bid for action in self.buy_actions], dtype=float)
+        self.buy_amounts = np.array([action.amount for action in self.buy_actions], dtype=float)
+        self.sell_bids = np.array([action.bid for action in self.sell_actions], dtype=float)
+        self.sell_amounts = np.array([action.amount for action in self.sell_actions], dtype=float)
+
+        bids = np.concatenate([self.buy_bids, self.sell_bids])
+        low = bids.min() if len(bids) > 0 else 0
+        high = bids.max() if len(bids) > 0 else 0
+        self.buckets = buckets
+        self.low = low
+        self.width = (high - low) / buckets if high > low else 1.0
+        self.price_error_bound = self.width
+        self.centers = low + (np.arange(buckets) + 0.5) * self.width
+
+        self.buy_bucket = self._bucket(self.buy_bids)
+        self.sell_bucket = self._bucket(self.sell_bids)
+        self.buy_hist = np.bincount(self.buy_bucket, weights=self.buy_amounts, minlength=buckets)
+        self.sell_hist = np.bincount(self.sell_bucket, weights=self.sell_amounts, minlength=buckets)
+
+        # demand[k]: buckets >= k, supply[k]: buckets < k
+        self.demand = np.concatenate([np.cumsum(self.buy_hist[::-1])[::-1], [0]])
+        self.supply = np.concatenate([[0], np.cumsum(self.sell_hist)])
+
+        self._bind_population()
+
+    def _bucket(self, bids):
+        return np.minimum(((bids - self.low) / self.width).astype(np.int64), self.buckets - 1)
+
+    def _first_bucket_from(self, price):
+        # first bucket whose center is >= price
+        k = int(np.ceil((price - self.low) / self.width - 0.5))
+        return min(max(k, 0), self.buckets)
+
+    def _bucket_count_to(self, price):
+        # number of buckets whose center is <= price
+        k = int(np.floor((price - self.low) / self.width - 0.5)) + 1
+        return min(max(k, 0), self.buckets)
+
+    def quantity_demanded(self, price):
+        return self.demand[self._first_bucket_from(price)]
+
+    def quantity_supplied(self, price):
+        return self.supply[self._bucket_count_to(price)]
+
+    def equilibrium_price(self):
+        if len(self.buy_bids) == 0 or len(self.sell_bids) == 0:
+            return 0
+
+        total_demand = self.demand[0]
+        if total_demand <= 0:
+            return 0
+
+        idx = np.searchsorted(self.supply[1:], total_demand, side="left")
+        if idx >= self.buckets:
+            idx = np.flatnonzero(self.sell_hist)[-1]
+        return self.centers[idx]
+
+    def match(self, buyer_price, seller_price):
+        buy_start = self._first_bucket_from(seller_price)
+        sell_end = self._bucket_count_to(buyer_price)
+        total = min(self.demand[buy_start], self.supply[sell_end])
+        if total <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        # price priority between buckets, pro-rata inside the marginal one
+        with np.errstate(divide="ignore", invalid="ignore"):
+            buy_fraction = np.clip((total - self.demand[1:]) / self.buy_hist, 0, 1)
+            sell_fraction = np.clip((total - self.supply[:-1]) / self.sell_hist, 0, 1)
+        buy_fraction[: buy_start] = 0
+        sell_fraction[sell_end:] = 0
+        buy_fraction = np.nan_to_num(buy_fraction)
+        sell_fraction = np.nan_to_num(sell_fraction)
+
+        buy_filled = self.buy_amounts * buy_fraction[self.buy_bucket]
+        sell_filled = self.sell_amounts * sell_fraction[self.sell_bucket]
+        buy_orders = np.flatnonzero(buy_filled > 0)
+        sell_orders = np.flatnonzero(sell_filled > 0)
+        if len(buy_orders) == 0 or len(sell_orders) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        buy_idx, sell_idx, amounts = pair_fills(np.cumsum(buy_filled[buy_orders]), np.cumsum(sell_filled[sell_orders]))
+        return buy_orders[buy_idx], sell_orders[sell_idx], amounts
+
+    def demand_curve(self, points=None):
+        curve = np.column_stack([self.centers[::-1], self.demand[1:][::-1]])
+        return downsample_curve(curve, points)
+
+    def supply_curve(self, points=None):
+        curve = np.column_stack([self.centers, self.supply[1:]])
+        return downsample_curve(curve, points)
@@ -0,0 +1,127 @@
+from time import perf_counter
+
+import numpy as np
+
+from miyanmaayeh.action import ActionType, MarketAction
+from miyanmaayeh.agent import Agent
+from miyanmaayeh.population import Population
+
+MAGIC = b"MMOF"
+VERSION = 1
+
+SIDES = {ActionType.Buy.value: 1, ActionType.Sell.value: 2}
+SIDE_TYPES = {side: action_type for action_type, side in SIDES.items()}
+
+# little-endian and unaligned, so files read the same on every machine
+FILE_HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u4")])
+TICK_HEADER_DTYPE = np.dtype([("tick", "<i8"), ("count", "<i8"), ("price", "<f8"), ("volume", "<f8")])
+ORDER_DTYPE = np.dtype([("side", "i1"), ("amount", "<f8"), ("bid", "<f8"), ("agent", "<i8")])
+
+
+class OrderFlowRecorder:
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = open(path, "wb")
+        np.array([(MAGIC, VERSION)], dtype=FILE_HEADER_DTYPE).tofile(self.file)
+
+    def record(self, tick, actions, market_history):
+        orders = [action for action in actions if action.type in SIDES]
+
+        records = np.empty(len(orders), dtype=ORDER_DTYPE)
+        records["side"] = [SIDES[action.type] for action in orders]
+        records["amount"] = [action.amount for action in orders]
+        records["bid"] = [action.bid for action in orders]
+        records["agent"] = [-1 if getattr(action.agent, "slot", None) is None else action.agent.slot for action in orders]
+
+        header = np.array([(tick, len(orders), market_history.price_equilibrium, market_history.volume)], dtype=TICK_HEADER_DTYPE)
+        header.tofile(self.file)
+        records.tofile(self.file)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_order_flow(path):
+    with open(path, "rb") as f:
+        file_header = np.fromfile(f, dtype=FILE_HEADER_DTYPE, count=1)
+        assert len(file_header) == 1 and file_header["magic"][0] == MAGIC, f"{path} is not an order-flow file"
+
+        while True:
+            header = np.fromfile(f, dtype=TICK_HEADER_DTYPE, count=1)
+            if len(header) == 0:
+                return
+            orders = np.fromfile(f, dtype=ORDER_DTYPE, count=int(header["count"][0]))
+            yield int(header["tick"][0]), float(header["price"][0]), float(header["volume"][0]), orders
+
+
+class ReplayReport:
+    def __init__(self, ticks, recorded_prices, prices, recorded_volumes, volumes, orders, clearing_seconds) -> None:
+        self.ticks = np.array(ticks)
+        self.recorded_prices = np.array(recorded_prices)
+        self.prices = np.array(prices)
+        self.recorded_volumes = np.array(recorded_volumes)
+        self.volumes = np.array(volumes)
+        self.orders = orders
+        self.clearing_seconds = clearing_seconds
+
+    @property
+    def orders_per_second(self):
+        return self.orders / max(self.clearing_seconds, 1e-12)
+
+    @property
+    def price_difference(self):
+        return np.abs(self.prices - self.recorded_prices)
+
+    @property
+    def volume_difference(self):
+        return np.abs(self.volumes - self.recorded_volumes)
+
+    def __str__(self):
+        return (
+            f"{len(self.ticks)} ticks, {self.orders} orders, {self.clearing_seconds:.3f}s clearing "
+            f"({self.orders_per_second:.0f} orders/s) - "
+            f"max price diff {self.price_difference.max(initial=0):.6f}, max volume diff {self.volume_difference.max(initial=0):.6f}"
+        )
+
+
+def replay_order_flow(path, market_cls, market_options={}):
+    market = market_cls(**market_options)
+
+    # stand-in agents only absorb settlement, one per recorded agent id; orders recorded without a slot (-1) share their own
+    population = Population([Agent.GROUP])
+    agents = []
+    unslotted = Agent(confidence_level=0, production=0, inventory=0, income=0, cash=0, seed=0)
+    population.add(unslotted)
+
+    ticks, recorded_prices, prices, recorded_volumes, volumes = [], [], [], [], []
+    orders_count = 0
+    clearing_seconds = 0
+
+    for tick, recorded_price, recorded_volume, orders in read_order_flow(path):
+        max_id = int(orders["agent"].max(initial=-1))
+        while len(agents) <= max_id:
+            agent = Agent(confidence_level=0, production=0, inventory=0, income=0, cash=0, seed=len(agents))
+            population.add(agent)
+            agents.append(agent)
+
+        market.new_tick()
+        columns = zip(orders["side"].tolist(), orders["amount"].tolist(), orders["bid"].tolist(), orders["agent"].tolist())
+        for side, amount, bid, agent_id in columns:
+            agent = unslotted if agent_id < 0 else agents[agent_id]
+            market.add_action(MarketAction(action_type=SIDE_TYPES[side], amount=amount, bid=bid, agent=agent))
+
+        start = perf_counter()
+        market.allocate_commodity()
+        clearing_seconds += perf_counter() - start
+
+        ticks.append(tick)
+        recorded_prices.append(recorded_price)
+        prices.append(market.history[-1].price_equilibrium)
+        recorded_volumes.append(recorded_volume)
+        volumes.append(market.history[-1].volume)
+        orders_count += len(orders)
+
+    return ReplayReport(ticks, recorded_prices, prices, recorded_volumes, volumes, orders_count, clearing_seconds)
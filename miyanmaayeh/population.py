@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class Population:
+    # Balances of the active agents, stored as arrays indexed by each agent's slot
+    def __init__(self, groups, capacity=1024) -> None:
+        self.groups = list(groups)
+        self.group_index = {group: i for i, group in enumerate(self.groups)}
+        self.size = 0
+
+        self.cash = np.zeros(capacity)
+        self.inventory = np.zeros(capacity)
+        self.income = np.zeros(capacity)
+        self.production = np.zeros(capacity)
+        self.group = np.zeros(capacity, dtype=np.int64)
+        self.weight = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.cash))
+        for name in ("cash", "inventory", "income", "production", "group", "weight"):
+            values = getattr(self, name)
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[: self.size] = values[: self.size]
+            setattr(self, name, grown)
+
+    def add(self, agent):
+        if self.size == len(self.cash):
+            self._grow()
+
+        slot = self.size
+        self.cash[slot] = agent.cash
+        self.inventory[slot] = agent.inventory
+        self.income[slot] = agent.income
+        self.production[slot] = agent.production
+        self.group[slot] = self.group_index[agent.GROUP]
+        self.weight[slot] = agent.weight
+        self.size += 1
+
+        agent.bind(self, slot)
+        return slot
+
+    def tick(self):
+        n = self.size
+        self.cash[:n] += self.income[:n]
+        self.inventory[:n] += self.production[:n]
+
+    def settle(self, slots, quantities, prices):
+        np.add.at(self.inventory, slots, quantities)
+        np.add.at(self.cash, slots, -quantities * prices)
+
+    def get_metrics(self, market_price):
+        n = self.size
+        cash = self.cash[:n]
+        inventory = self.inventory[:n]
+        return {
+            "wealth": cash + inventory * market_price,
+            "cash": cash,
+            "inventory": inventory,
+            "active": self.weight[:n],
+        }
+
+    def group_stats(self, market_price):
+        metrics = self.get_metrics(market_price)
+        group_count = len(self.groups)
+
+        # one bincount over (metric, group) cells covers every metric in a single pass
+        values = np.stack(list(metrics.values()))
+        idx = self.group[: self.size] + group_count * np.arange(len(metrics))[:, None]
+        totals = np.bincount(idx.ravel(), weights=values.ravel(), minlength=group_count * len(metrics))
+        totals = totals.reshape(len(metrics), group_count)
+
+        return {name: dict(zip(self.groups, row.tolist())) for name, row in zip(metrics, totals)}
+
+
+def assign_cohorts(attributes, activation_times, bins, window):
+    # cohort index per agent: each attribute is cut into equal-width bins over its range, activation times into fixed windows
+    keys = [np.floor(np.asarray(activation_times, dtype=float) / window).astype(np.int64)]
+    for values in attributes:
+        low, high = values.min(), values.max()
+        width = (high - low) / bins if high > low else 1.0
+        keys.append(np.minimum(((values - low) / width).astype(np.int64), bins - 1))
+
+    _, cohorts = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+    return cohorts.ravel()
@@ -0,0 +1,160 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+METRIC_COLUMNS = ("ticks", "market_profit", "final_price", "steady_slope", "steady_intercept")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    sweep TEXT,
+    seed INTEGER,
+    config TEXT,
+    created REAL,
+    ticks INTEGER,
+    market_profit REAL,
+    final_price REAL,
+    steady_slope REAL,
+    steady_intercept REAL
+);
+CREATE INDEX IF NOT EXISTS runs_sweep ON runs (sweep);
+CREATE INDEX IF NOT EXISTS runs_market_profit ON runs (market_profit);
+CREATE INDEX IF NOT EXISTS runs_steady_slope ON runs (steady_slope);
+
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id INTEGER REFERENCES runs (id),
+    name TEXT,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS run_params_name_value ON run_params (name, value, run_id);
+
+CREATE TABLE IF NOT EXISTS run_arrays (
+    run_id INTEGER REFERENCES runs (id),
+    name TEXT,
+    dtype TEXT,
+    shape TEXT,
+    data BLOB,
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+
+def flatten_config(config, prefix=""):
+    # numeric leaves keyed by dotted path, e.g. "market-options.friction_rate"
+    params = {}
+    for key, value in config.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            params.update(flatten_config(value, prefix=f"{name}."))
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            params[name] = float(value)
+    return params
+
+
+def _config_to_json(config):
+    return json.dumps(config, default=lambda x: getattr(x, "__name__", type(x).__name__))
+
+
+class ResultsStore:
+    def __init__(self, path) -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, config, metrics, arrays={}, sweep=None, seed=None):
+        columns = [name for name in METRIC_COLUMNS if name in metrics]
+        values = [float(metrics[name]) for name in columns]
+
+        names = ", ".join(["sweep", "seed", "config", "created"] + columns)
+        placeholders = ", ".join(["?"] * (4 + len(columns)))
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO runs ({names}) VALUES ({placeholders})",
+                [sweep, seed, _config_to_json(config), time.time()] + values,
+            )
+            run_id = cursor.lastrowid
+
+            self.connection.executemany(
+                "INSERT INTO run_params (run_id, name, value) VALUES (?, ?, ?)",
+                [(run_id, name, value) for name, value in flatten_config(config).items()],
+            )
+            self.connection.executemany(
+                "INSERT INTO run_arrays (run_id, name, dtype, shape, data) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, name, str(array.dtype), json.dumps(array.shape), array.tobytes()) for name, array in arrays.items()],
+            )
+
+        return run_id
+
+    def add_summary(self, config, summary, sweep=None, seed=None):
+        metrics = {
+            "ticks": int(summary.ticks[-1]) + 1,
+            "market_profit": summary.market_profit,
+            "final_price": summary.prices[-1],
+            "steady_slope": summary.trendline.coefficients[0],
+            "steady_intercept": summary.trendline.coefficients[1],
+        }
+        arrays = {"prices": np.ascontiguousarray(summary.prices), "ticks": np.ascontiguousarray(summary.ticks)}
+        arrays.update({f"wealth.{group}": np.ascontiguousarray(values) for group, values in summary.wealth.items()})
+        return self.add_run(config, metrics, arrays=arrays, sweep=sweep, seed=seed)
+
+    def _filters(self, params={}, metrics={}, sweep=None):
+        # params and metrics map a name to an inclusive (low, high) range; None leaves that side open
+        clauses, args = [], []
+        if sweep is not None:
+            clauses.append("runs.sweep = ?")
+            args.append(sweep)
+
+        for name, (low, high) in metrics.items():
+            assert name in METRIC_COLUMNS, f"unknown metric {name}"
+            if low is not None:
+                clauses.append(f"runs.{name} >= ?")
+                args.append(low)
+            if high is not None:
+                clauses.append(f"runs.{name} <= ?")
+                args.append(high)
+
+        for name, (low, high) in params.items():
+            clause = "runs.id IN (SELECT run_id FROM run_params WHERE name = ?"
+            args.append(name)
+            if low is not None:
+                clause += " AND value >= ?"
+                args.append(low)
+            if high is not None:
+                clause += " AND value <= ?"
+                args.append(high)
+            clauses.append(clause + ")")
+
+        return (" WHERE " + " AND ".join(clauses)) if len(clauses) > 0 else "", args
+
+    def query(self, params={}, metrics={}, sweep=None):
+        where, args = self._filters(params, metrics, sweep)
+        columns = ("id", "sweep", "seed", "config") + METRIC_COLUMNS
+        rows = self.connection.execute(f"SELECT {', '.join('runs.' + name for name in columns)} FROM runs{where}", args).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def aggregate(self, param, metric="market_profit", sweep=None):
+        # (param value, mean metric, run count) ordered by the parameter
+        assert metric in METRIC_COLUMNS, f"unknown metric {metric}"
+        where, args = self._filters(sweep=sweep)
+        where = where.replace(" WHERE ", " AND ", 1)
+        return self.connection.execute(
+            f"SELECT run_params.value, AVG(runs.{metric}), COUNT(*) FROM run_params JOIN runs ON runs.id = run_params.run_id "
+            f"WHERE run_params.name = ?{where} GROUP BY run_params.value ORDER BY run_params.value",
+            [param] + args,
+        ).fetchall()
+
+    def get_array(self, run_id, name):
+        row = self.connection.execute(
+            "SELECT dtype, shape, data FROM run_arrays WHERE run_id = ? AND name = ?",
+            (run_id, name),
+        ).fetchone()
+        if row is None:
+            return None
+        dtype, shape, data = row
+        return np.frombuffer(data, dtype=dtype).reshape(json.loads(shape))
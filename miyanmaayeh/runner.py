@@ -1,13 +1,14 @@
 import math
+from collections import deque
+from copy import deepcopy
 from pathlib import Path
-from time import time
+from time import perf_counter
 
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
 from tqdm import tqdm
 
-from miyanmaayeh.action import ActionType
 from miyanmaayeh.agent import (
     Agent,
     ContrarianAgent,
@@ -18,9 +19,13 @@ from miyanmaayeh.agent import (
     TechnicalAnalystAgent,
     VerificationAgent,
 )
-from miyanmaayeh.history import RunHistory
+from miyanmaayeh.history import MultiResolutionHistory, RunHistory
+from miyanmaayeh.ledger import FillLedger
 from miyanmaayeh.market import Market
-from miyanmaayeh.utils import get_steady_state
+from miyanmaayeh.order_flow import OrderFlowRecorder
+from miyanmaayeh.population import Population, assign_cohorts
+from miyanmaayeh.trajectory import TrajectoryWriter
+from miyanmaayeh.utils import get_steady_state, get_trendline
 
 agent_key_to_class = {
     "fundamentalist_count": FundamentalistAgent,
@@ -35,15 +40,32 @@ agent_key_to_class = {
 
 class Runner:
     def __init__(self, config) -> None:
+        self.seed = config.get("seed", None)
+        if self.seed is not None:
+            np.random.seed(self.seed)
+
+        seed_sequence = np.random.SeedSequence(self.seed)
+        self.seed_entropy = seed_sequence.entropy
+        self.rng = np.random.default_rng(seed_sequence)
+        self.agent_count = 0
+
         market_cls = config.get("market-class", Market)
         self.market_options = config.get("market-options", {})
         self.market = market_cls(**self.market_options)
 
+        self.tick = 0
+        self.clearing_seconds = 0
         self.agents = []
+        self.pending_agents = []
         self.history = []
-        self.take_snapshots_in = config.get("snapshots_in")
+        self.snapshots = {}
+        self.take_snapshots_in = config.get("snapshots_in", [])
+        self.snapshot_ticks = set(self.take_snapshots_in)
+        self.snapshot_points = config.get("snapshot_points", None)
 
         self.agents_config = config.get("agents-config", {})
+        # with cohorts, agents of a class with similar attributes and activation times are simulated as one weighted agent
+        self.cohorts = config.get("cohorts", None)
         initial_agents = config.get("initial_agents", 0)
         new_agents = config.get("new_agents", 0)
         avg_wait_time = config.get("average_time_to_add_agents", 0.0001)
@@ -55,123 +77,254 @@ class Runner:
 
             # Compose new agents
             agent_count = int(new_agents * config.get(agent_key, 0))
-            activation_times = np.random.exponential(1 / avg_wait_time, size=agent_count)
+            activation_times = self.rng.exponential(1 / avg_wait_time, size=agent_count)
             self.initialize_agents(agent_cls, agent_count, self.agents_config, activation_times)
 
+        # Agents wait in activation order and join self.agents exactly at their activation tick
+        self.pending_agents = deque(sorted(self.pending_agents, key=lambda x: x.activation_time))
+        self.groups = list(dict.fromkeys([item.GROUP for item in self.pending_agents]))
+        self.population = Population(self.groups)
+
+        # with a trajectory_dir, per-tick history goes to memory-mapped files instead of self.history
+        trajectory_dir = config.get("trajectory_dir", None)
+        self.trajectory = None if trajectory_dir is None else TrajectoryWriter(trajectory_dir, self.groups)
+
+        # keeps recent ticks at full resolution and rolls older ones up into OHLC bars, see MultiResolutionHistory
+        multi_resolution = config.get("multi_resolution_history", None)
+        self.multi_resolution = None if multi_resolution is None else MultiResolutionHistory(**multi_resolution)
+
+        # the file is truncated here, so every run needs its own path; close() releases it
+        order_flow_path = config.get("order_flow_path", None)
+        self.order_flow = None if order_flow_path is None else OrderFlowRecorder(order_flow_path)
+
+        # per-fill ledger options, see FillLedger; without a path the ledger stays in memory, with one the file is
+        # truncated here like the order-flow file, so every run needs its own path
+        fill_ledger = config.get("fill_ledger", None)
+        self.market.ledger = None if fill_ledger is None else FillLedger(**fill_ledger)
+
+        # a started RunMetrics; it may be shared by all runs of a sweep
+        self.metrics = config.get("metrics", None)
+
         self.plot_dir = config.get("plot_dir", None)
         if self.plot_dir is not None:
             Path(self.plot_dir).mkdir(parents=True, exist_ok=True)
 
     def initialize_agents(self, agent_cls: Agent, cnt, agents_config, activation_times):
-        np.random.seed(int(time()))
-        for i in range(cnt):
-            confidence_level = np.random.normal(0.5, 0.5 / 3)
-            if confidence_level > 0.9:
-                confidence_level = 0.9
-            if confidence_level < 0.1:
-                confidence_level = 0.1
-
-            production_avg = agents_config.get("production-average", 1000)
-            production_std = agents_config.get("production-std", 200)
-            producers_count = agents_config.get("producers-percentage", 20)
-            production = np.random.normal(production_avg, production_std)
-            is_producer = np.random.uniform(0, 100) <= producers_count
-            if production < 0 or not is_producer:
-                production = 0
-
-            income_alpha = agents_config.get("income-alpha", 4)
-            income_beta = agents_config.get("income-beta", 1500)
-            income = np.random.gamma(income_alpha, income_beta)
-
+        production_avg = agents_config.get("production-average", 1000)
+        production_std = agents_config.get("production-std", 200)
+        producers_count = agents_config.get("producers-percentage", 20)
+        income_alpha = agents_config.get("income-alpha", 4)
+        income_beta = agents_config.get("income-beta", 1500)
+
+        # one draw per attribute for the whole class
+        confidence_levels = np.clip(self.rng.normal(0.5, 0.5 / 3, size=cnt), 0.1, 0.9)
+        productions = self.rng.normal(production_avg, production_std, size=cnt)
+        is_producer = self.rng.uniform(0, 100, size=cnt) <= producers_count
+        productions[(productions < 0) | ~is_producer] = 0
+        incomes = self.rng.gamma(income_alpha, income_beta, size=cnt)
+
+        first_id = self.agent_count
+        self.agent_count += cnt
+
+        activation_times = np.asarray(activation_times)
+        ids = np.arange(cnt)
+        weights = np.ones(cnt, dtype=np.int64)
+        if self.cohorts is not None and cnt > 0:
+            cohorts = assign_cohorts(
+                [confidence_levels, productions, incomes],
+                activation_times,
+                bins=self.cohorts.get("bins", 4),
+                window=self.cohorts.get("activation-window", 10),
+            )
+            # flows are summed over the members, confidence and activation time averaged; ids come from the first member
+            weights = np.bincount(cohorts)
+            _, ids = np.unique(cohorts, return_index=True)
+            confidence_levels = np.bincount(cohorts, weights=confidence_levels) / weights
+            productions = np.bincount(cohorts, weights=productions)
+            incomes = np.bincount(cohorts, weights=incomes)
+            activation_times = np.bincount(cohorts, weights=activation_times) / weights
+
+        attributes = zip(
+            ids.tolist(),
+            weights.tolist(),
+            confidence_levels.tolist(),
+            productions.tolist(),
+            incomes.tolist(),
+            activation_times.tolist(),
+        )
+        for i, weight, confidence_level, production, income, activation_time in attributes:
             agent = agent_cls(
                 confidence_level=confidence_level,
                 production=production,
-                inventory=agents_config.get("initial-inventory", 0),
+                inventory=agents_config.get("initial-inventory", 0) * weight,
                 income=income,
-                cash=agents_config.get("initial-cash", 0),
-                activation_time=activation_times[i],
+                cash=agents_config.get("initial-cash", 0) * weight,
+                activation_time=activation_time,
+                # child stream keyed by (run entropy, agent id), created on first use
+                seed=(self.seed_entropy, first_id + i),
+                weight=weight,
             )
+            self.pending_agents.append(agent)
+
+    def activate_agents(self, tick):
+        while len(self.pending_agents) > 0 and self.pending_agents[0].activation_time <= tick:
+            agent = self.pending_agents.popleft()
+            agent.is_active = True
+            self.population.add(agent)
             self.agents.append(agent)
 
     def run(self, ticks):
-        for tick in tqdm(range(ticks)):
+        for tick in tqdm(range(self.tick, self.tick + ticks)):
+            self.tick = tick + 1
             self.market.new_tick()
-            for agent in self.agents:
-                agent.tick(tick)
+            self.activate_agents(tick)
+            self.population.tick()
 
             self.run_iteration(tick)
+            if self.order_flow is not None:
+                self.order_flow.record(tick, self.market.actions, self.market.history[-1])
 
             self.sort_agents_by_welfare()
             self.record_history(tick)
 
+            if self.metrics is not None:
+                market_history = self.market.history[-1]
+                self.metrics.record_tick(
+                    active_agents=int(self.population.weight[: self.population.size].sum()),
+                    orders=market_history.buy_action_count + market_history.sell_action_count,
+                    fills=market_history.fill_count,
+                    clearing_seconds=self.clearing_seconds,
+                    market_price=market_history.price_equilibrium,
+                )
+
+        if self.trajectory is not None:
+            self.trajectory.flush()
+        if self.order_flow is not None:
+            self.order_flow.flush()
+        if self.market.ledger is not None:
+            self.market.ledger.flush()
+
+    def __getstate__(self):
+        # the metrics sink holds a server socket, a sampler thread and a logger, so copies and pickles leave it behind
+        state = self.__dict__.copy()
+        state["metrics"] = None
+        return state
+
+    def close(self):
+        # releases the files held by the recorders; everything already in memory stays usable
+        if self.trajectory is not None:
+            self.trajectory.flush()
+        if self.order_flow is not None:
+            self.order_flow.close()
+        if self.market.ledger is not None:
+            self.market.ledger.close()
+
+    def set_market(self, market_cls, market_options):
+        history = self.market.history
+        ledger = self.market.ledger
+        self.market_options = market_options
+        self.market = market_cls(**market_options)
+        self.market.history = history
+        self.market.ledger = ledger
+
+    def snapshot(self):
+        # the trajectory writer, order-flow recorder and fill ledger own files, so they are not copied;
+        # metrics never are, see __getstate__
+        trajectory, self.trajectory = self.trajectory, None
+        order_flow, self.order_flow = self.order_flow, None
+        ledger, self.market.ledger = self.market.ledger, None
+        state = RunnerSnapshot(deepcopy(self), np.random.get_state(), trajectory)
+        self.trajectory = trajectory
+        self.order_flow = order_flow
+        self.market.ledger = ledger
+        return state
+
     def sort_agents_by_welfare(self):
         market_price = self.market.history[-1].price_equilibrium
-        self.agents = sorted(self.agents, key=lambda x: (-market_price * x.inventory + x.cash) * (x.GROUP != "Copycat"))
+        population = self.population
+        n = population.size
+
+        # per participant, so cohort agents rank by their members' welfare rather than their size
+        welfare = (-market_price * population.inventory[:n] + population.cash[:n]) / population.weight[:n]
+        welfare *= population.group[:n] != population.group_index.get("Copycat", -1)
+
+        slots = np.array([agent.slot for agent in self.agents], dtype=np.int64)
+        order = np.argsort(welfare[slots], kind="stable")
+        self.agents = [self.agents[i] for i in order]
 
     def run_iteration(self, tick):
         market_history = self.market.get_history()
         best_agents = self.agents[:10]
 
         for agent in self.agents:
-            if not agent.is_active:
-                continue
-
             action = agent.get_action(market_history, best_agents=best_agents)
             self.market.add_action(action)
 
+        clearing_start = perf_counter()
         self.market.allocate_commodity()
+        self.clearing_seconds = perf_counter() - clearing_start
 
     def record_history(self, tick):
         market_price = self.market.history[-1].price_equilibrium
-        # wealth = 0
-        groups = set([item.GROUP for item in self.agents])
-        wealth = {group: 0 for group in groups}
-        for agent in self.agents:
-            if not agent.is_active:
-                continue
-            wealth[agent.GROUP] += agent.cash + agent.inventory * market_price
+        group_stats = self.population.group_stats(market_price)
 
         history = RunHistory(
             volume=self.market.history[-1].volume,
             sell_actions=self.market.history[-1].sell_action_count,
             buy_actions=self.market.history[-1].buy_action_count,
             price=market_price,
-            wealth=wealth,
+            wealth=group_stats["wealth"],
             market_profit=self.market.history[-1].profit,
+            group_stats=group_stats,
         )
 
-        if tick in self.take_snapshots_in:
+        if tick in self.snapshot_ticks:
             history.demands, history.supplies = self._extract_demand_supply()
-
-        self.history.append(history)
+            self.snapshots[tick] = history
+
+        if self.trajectory is not None:
+            self.trajectory.append(history)
+        elif self.multi_resolution is not None:
+            self.multi_resolution.append(history)
+        else:
+            self.history.append(history)
+
+    # With multi_resolution_history the series are bars: span=1 keeps every tick of the recent window and the older
+    # ticks at the resolution they were rolled up to, a larger span merges bars until each covers at least that many ticks.
+    # Bars are unevenly spaced, so pair the series with get_ticks() of the same span. Other modes always have one value per tick.
+    def _get_bars(self, span):
+        return self.multi_resolution.bars(span)
+
+    def get_ticks(self, span=1):
+        if self.multi_resolution is not None:
+            # a bar's price and wealth are taken at its close, the last tick it covers
+            return np.array([bar.start + bar.ticks - 1 for bar in self._get_bars(span)])
+        return np.arange(0, len(self.get_series("price")))
+
+    def get_spans(self, span=1):
+        # number of ticks each value of the series covers
+        if self.multi_resolution is not None:
+            return np.array([bar.ticks for bar in self._get_bars(span)])
+        return np.ones(len(self.get_series("price")), dtype=np.int64)
+
+    def get_series(self, name, span=1):
+        if self.trajectory is not None:
+            return self.trajectory.arrays[name][: self.trajectory.ticks]
+        if self.multi_resolution is not None:
+            return np.array([getattr(bar, name) for bar in self._get_bars(span)])
+        return np.array([getattr(item, name) for item in self.history])
+
+    def get_wealth_series(self, group, span=1):
+        if self.trajectory is not None:
+            return self.trajectory.arrays["wealth"][: self.trajectory.ticks, self.groups.index(group)]
+        if self.multi_resolution is not None:
+            return np.array([bar.wealth[group] for bar in self._get_bars(span)])
+        return np.array([item.wealth[group] for item in self.history])
 
     def _extract_demand_supply(self):
-        actions = self.market.actions
-
-        demand_actions = []
-        supply_actions = []
-
-        for action in actions:
-            if action.type == ActionType.Buy.value:
-                demand_actions.append(action)
-            elif action.type == ActionType.Sell.value:
-                supply_actions.append(action)
-
-        demand_actions = sorted(demand_actions, key=lambda x: -x.bid)
-        supply_actions = sorted(supply_actions, key=lambda x: x.bid)
-
-        q_d = 0
-        demand_series = []
-        for demand in demand_actions:
-            demand_series.append((demand.bid, q_d))
-            q_d += demand.amount
-
-        q_s = 0
-        supply_series = []
-        for supply in supply_actions:
-            q_s += supply.amount
-            supply_series.append((supply.bid, q_s))
-
+        order_book = self.market.get_order_book()
+        demand_series = order_book.demand_curve(self.snapshot_points)
+        supply_series = order_book.supply_curve(self.snapshot_points)
         return demand_series, supply_series
 
     def generate_plot(self):
@@ -189,13 +342,13 @@ class Runner:
         plt.close("all")
 
     def generate_price_plot(self):
-        prices = [item.price for item in self.history]
-        ticks = np.arange(0, len(prices))
+        prices = self.get_series("price")
+        ticks = self.get_ticks()
 
-        steady_ticks, steady_prices = get_steady_state(prices)
+        steady_idx, steady_prices = get_steady_state(prices)
+        steady_ticks = ticks[steady_idx]
 
-        z = np.polyfit(steady_ticks, steady_prices, 1)
-        trendline_func = np.poly1d(z)
+        trendline_func = get_trendline(steady_ticks, steady_prices)
         trendline = [trendline_func(tick) for tick in steady_ticks]
 
         plt.figure("Market Price", figsize=(12, 8))
@@ -214,23 +367,23 @@ class Runner:
         plt.close("Market Price")
 
     def generate_wealth_plot(self):
-        wealth = [item.wealth for item in self.history]
-        groups = set([item.GROUP for item in self.agents])
+        ticks = self.get_ticks()
 
         plt.figure("Society Welfare")
-        for group in groups:
-            y = [item[group] for item in wealth]
-            fig = sns.lineplot(x=np.arange(0, len(y)), y=y, label=group, legend="brief")
+        for group in self.groups:
+            y = self.get_wealth_series(group)
+            fig = sns.lineplot(x=ticks, y=y, label=group, legend="brief")
         fig.set(xlabel="Time", ylabel="Wealth", title="Society Welfare")
 
         plt.savefig(self.plot_dir + "welfare.png")
         plt.close("Society Welfare")
 
     def generate_volume_plot(self):
-        volume = [item.volume for item in self.history]
+        # per tick, so rolled-up bars are comparable with single ticks
+        volume = self.get_series("volume") / self.get_spans()
 
         plt.figure("Market Volume")
-        fig = sns.lineplot(x=np.arange(0, len(volume)), y=volume)
+        fig = sns.lineplot(x=self.get_ticks(), y=volume)
         fig.set(xlabel="Time", ylabel="Quantity", title="Market Volume")
 
         plt.savefig(self.plot_dir + "volume.png")
@@ -248,17 +401,44 @@ class Runner:
             plot_x = int(i // width)
             plot_y = int(i % width)
 
-            demands = self.history[tick].demands
-            supplies = self.history[tick].supplies
+            demands = self.snapshots[tick].demands
+            supplies = self.snapshots[tick].supplies
 
             if len(demands) > 0:
-                ax[plot_x, plot_y].plot([x[0] for x in demands], [x[1] for x in demands], label="Demand")
+                ax[plot_x, plot_y].plot(demands[:, 0], demands[:, 1], label="Demand")
             if len(supplies) > 0:
-                ax[plot_x, plot_y].plot([x[0] for x in supplies], [x[1] for x in supplies], label="Supply")
+                ax[plot_x, plot_y].plot(supplies[:, 0], supplies[:, 1], label="Supply")
             ax[plot_x, plot_y].legend(loc="upper right", fontsize=14)
-            ax[plot_x, plot_y].set_title(f"Iteration {tick + 1} - Price = {self.history[tick].price:.2f}", fontsize=24)
+            ax[plot_x, plot_y].set_title(f"Iteration {tick + 1} - Price = {self.snapshots[tick].price:.2f}", fontsize=24)
             ax[plot_x, plot_y].set_xlabel("Price", fontsize=16)
             ax[plot_x, plot_y].set_ylabel("Quantity", fontsize=16)
 
         plt.savefig(self.plot_dir + "supply-demand.png")
         plt.close("Supply Demand")
+
+
+class RunnerSnapshot:
+    def __init__(self, runner, rng_state, trajectory=None) -> None:
+        self.runner = runner
+        self.rng_state = rng_state
+        self.trajectory = trajectory
+
+    def fork(self, market_options=None, market_cls=None, trajectory_dir=None, fill_ledger=None, copy=True):
+        # copy=False hands out the stored runner itself, e.g. inside an already forked process
+        branch = deepcopy(self.runner) if copy else self.runner
+        np.random.set_state(self.rng_state)
+
+        if market_options is not None or market_cls is not None:
+            market_cls = type(branch.market) if market_cls is None else market_cls
+            market_options = branch.market_options if market_options is None else market_options
+            branch.set_market(market_cls, market_options)
+
+        if trajectory_dir is not None:
+            branch.trajectory = TrajectoryWriter(trajectory_dir, branch.groups)
+            if self.trajectory is not None:
+                branch.trajectory.copy_from(self.trajectory, branch.tick)
+
+        if fill_ledger is not None:
+            branch.market.ledger = FillLedger(**fill_ledger)
+
+        return branch
@@ -0,0 +1,215 @@
+import math
+
+from scipy import stats
+
+from miyanmaayeh.runner import Runner
+
+
+def total_market_profit(runner):
+    return runner.get_series("market_profit").sum()
+
+
+class RunningStats:
+    # Welford's online mean and variance
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return math.inf
+        return self.m2 / (self.count - 1)
+
+    def interval_width(self, confidence=0.95):
+        if self.count < 2:
+            return math.inf
+        t = stats.t.ppf(0.5 + confidence / 2, self.count - 1)
+        return 2 * t * math.sqrt(self.variance / self.count)
+
+
+class AdaptiveSweep:
+    def __init__(
+        self,
+        build_config,
+        ticks,
+        target_width,
+        relative=False,
+        objective=total_market_profit,
+        confidence=0.95,
+        min_replicas=3,
+        max_replicas=30,
+        seed=None,
+        on_run=None,
+    ) -> None:
+        self.build_config = build_config  # (point, replica) -> runner config
+        self.ticks = ticks
+        self.target_width = target_width
+        self.relative = relative
+        self.objective = objective
+        self.confidence = confidence
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.seed = seed
+        self.on_run = on_run
+        self.results = {}
+
+    def _target(self, point_stats):
+        if self.relative:
+            return self.target_width * abs(point_stats.mean)
+        return self.target_width
+
+    def _uncertainty(self, point):
+        point_stats = self.results[point]
+        return point_stats.interval_width(self.confidence) / max(self._target(point_stats), 1e-12)
+
+    def is_done(self, point):
+        point_stats = self.results[point]
+        if point_stats.count >= self.max_replicas:
+            return True
+        if point_stats.count < self.min_replicas:
+            return False
+        return point_stats.interval_width(self.confidence) <= self._target(point_stats)
+
+    def run_replica(self, point):
+        replica = self.results[point].count
+        config = self.build_config(point, replica)
+        if self.seed is not None:
+            # replica r of every point shares one seed: common random numbers across the sweep
+            config["seed"] = self.seed + replica
+
+        runner = Runner(config=config)
+        runner.run(self.ticks)
+        self.results[point].add(self.objective(runner))
+
+        if self.on_run is not None:
+            self.on_run(point, replica, runner)
+        runner.close()
+
+    def run(self, points, budget=None):
+        for point in points:
+            self.results.setdefault(point, RunningStats())
+
+        runs = 0
+        while budget is None or runs < budget:
+            pending = [point for point in points if not self.is_done(point)]
+            if len(pending) == 0:
+                break
+
+            # widest interval first, so replicas go where the curve is still uncertain
+            point = max(pending, key=self._uncertainty)
+            self.run_replica(point)
+            runs += 1
+
+        return {point: self.results[point] for point in points}
+
+
+def set_parameter(config, path, value):
+    # path like "market-options.friction_rate"; only the dicts along the path are copied
+    keys = path.split(".")
+    config = dict(config)
+    node = config
+    for key in keys[:-1]:
+        node[key] = dict(node.get(key, {}))
+        node = node[key]
+    node[keys[-1]] = value
+    return config
+
+
+def parameter_config(config, path):
+    return lambda point, replica: set_parameter(config, path, point)
+
+
+class SearchResult:
+    def __init__(self, explored, low, high, best_point, best_mean) -> None:
+        self.explored = explored  # (point, mean, replicas, interval width), sorted by point
+        self.low = low
+        self.high = high
+        self.estimate = (low + high) / 2
+        self.best_point = best_point
+        self.best_mean = best_mean
+
+
+class GoldenSectionSearch(AdaptiveSweep):
+    # Golden-section search on a noisy objective; each comparison adds replicas until the intervals separate
+    INV_PHI = (math.sqrt(5) - 1) / 2
+
+    def __init__(
+        self,
+        build_config,
+        ticks,
+        objective=total_market_profit,
+        confidence=0.95,
+        min_replicas=3,
+        max_replicas=10,
+        seed=None,
+        on_run=None,
+        maximize=True,
+    ) -> None:
+        super().__init__(
+            build_config,
+            ticks,
+            target_width=0,
+            objective=objective,
+            confidence=confidence,
+            min_replicas=min_replicas,
+            max_replicas=max_replicas,
+            seed=seed,
+            on_run=on_run,
+        )
+        self.maximize = maximize
+
+    def _score(self, point):
+        return self.results[point].mean if self.maximize else -self.results[point].mean
+
+    def evaluate(self, point):
+        self.results.setdefault(point, RunningStats())
+        while self.results[point].count < self.min_replicas:
+            self.run_replica(point)
+        return self.results[point]
+
+    def is_better(self, a, b):
+        while True:
+            stats_a, stats_b = self.results[a], self.results[b]
+            separation = (stats_a.interval_width(self.confidence) + stats_b.interval_width(self.confidence)) / 2
+            if abs(stats_a.mean - stats_b.mean) >= separation:
+                break
+            if stats_a.count >= self.max_replicas and stats_b.count >= self.max_replicas:
+                break
+
+            if stats_a.count < self.max_replicas:
+                self.run_replica(a)
+            if stats_b.count < self.max_replicas:
+                self.run_replica(b)
+
+        return self._score(a) >= self._score(b)
+
+    def search(self, low, high, tolerance):
+        c = high - self.INV_PHI * (high - low)
+        d = low + self.INV_PHI * (high - low)
+        self.evaluate(c)
+        self.evaluate(d)
+
+        while high - low > tolerance:
+            if self.is_better(c, d):
+                high, d = d, c
+                c = high - self.INV_PHI * (high - low)
+                self.evaluate(c)
+            else:
+                low, c = c, d
+                d = low + self.INV_PHI * (high - low)
+                self.evaluate(d)
+
+        explored = [
+            (point, point_stats.mean, point_stats.count, point_stats.interval_width(self.confidence))
+            for point, point_stats in sorted(self.results.items())
+        ]
+        best_point = max([point for point in self.results if low <= point <= high], key=self._score)
+        return SearchResult(explored, low, high, best_point, self.results[best_point].mean)
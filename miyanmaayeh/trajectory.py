@@ -0,0 +1,111 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+HEADER_FILE = "header.json"
+
+TRAJECTORY_FIELDS = {
+    "price": "float64",
+    "volume": "float64",
+    "sell_action_count": "int64",
+    "buy_action_count": "int64",
+    "market_profit": "float64",
+}
+
+
+class TrajectoryWriter:
+    # One raw array file per field, mapped into memory and grown by doubling; header.json describes the layout.
+    # The header is rewritten on every resize and every flush_interval ticks, so Trajectory can open a run that is still going.
+    def __init__(self, path, groups, capacity=1024, flush_interval=1024) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.groups = list(groups)
+        self.flush_interval = flush_interval
+        self.ticks = 0
+        self.capacity = 0
+        self.arrays = {}
+        self._resize(capacity)
+
+    def _shape(self, name, capacity):
+        if name == "wealth":
+            return (capacity, len(self.groups))
+        return (capacity,)
+
+    def _dtype(self, name):
+        return TRAJECTORY_FIELDS.get(name, "float64")
+
+    def _resize(self, capacity):
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays = {}
+
+        for name in list(TRAJECTORY_FIELDS) + ["wealth"]:
+            shape = self._shape(name, capacity)
+            f_name = self.path / f"{name}.bin"
+            with open(f_name, "ab") as f:
+                f.truncate(int(np.prod(shape)) * np.dtype(self._dtype(name)).itemsize)
+            self.arrays[name] = np.memmap(f_name, dtype=self._dtype(name), mode="r+", shape=shape)
+
+        self.capacity = capacity
+        self._write_header()
+
+    def append(self, history):
+        if self.ticks >= self.capacity:
+            self._resize(2 * self.capacity)
+
+        for name in TRAJECTORY_FIELDS:
+            self.arrays[name][self.ticks] = getattr(history, name)
+        self.arrays["wealth"][self.ticks] = [history.wealth[group] for group in self.groups]
+        self.ticks += 1
+
+        if self.ticks % self.flush_interval == 0:
+            self.flush()
+
+    def copy_from(self, writer, ticks):
+        while self.capacity < ticks:
+            self._resize(2 * self.capacity)
+
+        for name, array in writer.arrays.items():
+            self.arrays[name][:ticks] = array[:ticks]
+        self.ticks = ticks
+        self.flush()
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+        self._write_header()
+
+    def _write_header(self):
+        fields = {name: {"dtype": self._dtype(name), "shape": list(self._shape(name, self.capacity))} for name in self.arrays}
+        header = {"ticks": self.ticks, "groups": self.groups, "fields": fields}
+        # written aside and renamed, so a reader never sees a half-written header
+        temporary = self.path / f"{HEADER_FILE}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(header, f, indent=2)
+        temporary.replace(self.path / HEADER_FILE)
+
+
+class Trajectory:
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        with open(self.path / HEADER_FILE) as f:
+            self.header = json.load(f)
+
+        self.ticks = self.header["ticks"]
+        self.groups = self.header["groups"]
+
+        # views are trimmed to the written ticks; nothing is read until sliced
+        self.arrays = {}
+        for name, field in self.header["fields"].items():
+            array = np.memmap(self.path / f"{name}.bin", dtype=field["dtype"], mode="r", shape=tuple(field["shape"]))
+            self.arrays[name] = array[: self.ticks]
+
+    def __len__(self):
+        return self.ticks
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def get_wealth(self, group):
+        return self.arrays["wealth"][:, self.groups.index(group)]
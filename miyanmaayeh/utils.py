@@ -14,3 +14,8 @@ def get_steady_state(prices_list, batch_len=25, alpha=0.05):
             return list(range(batch_len * i, len(prices_list))), prices_list[batch_len * i:]
 
     return list(range(len(prices_list))), prices_list
+
+
+def get_trendline(ticks, prices):
+    z = np.polyfit(ticks, prices, 1)
+    return np.poly1d(z)
@@ -0,0 +1,365 @@
+import numpy as np
+from tqdm import tqdm
+
+from miyanmaayeh.agent import (
+    ContrarianAgent,
+    CopyCatAgent,
+    FundamentalistAgent,
+    LongTermBuyerAgent,
+    RandomAgent,
+    TechnicalAnalystAgent,
+    VerificationAgent,
+)
+from miyanmaayeh.history import RunSummary
+from miyanmaayeh.market import Market, MarketWithFriction
+from miyanmaayeh.runner import agent_key_to_class
+from miyanmaayeh.utils import get_steady_state, get_trendline
+
+SKIP = 0
+BUY = 1
+SELL = 2
+
+HISTORY_LENGTH = 10
+BEST_AGENTS = 10
+
+
+class VectorizedEnsemble:
+    # Advances R replicas of one config together; agent state is held as (replicas, agents) arrays.
+    # Decision rules mirror the agent classes in miyanmaayeh.agent, each replica draws from its own stream.
+    def __init__(self, config, replicas) -> None:
+        self.replicas = replicas
+        seed_sequence = np.random.SeedSequence(config.get("seed", None))
+        self.rngs = [np.random.default_rng(child) for child in seed_sequence.spawn(replicas)]
+
+        market_cls = config.get("market-class", Market)
+        market_options = config.get("market-options", {})
+        if market_cls not in (Market, MarketWithFriction):
+            raise ValueError(f"VectorizedEnsemble does not support the market class {market_cls.__name__}")
+        unsupported = [name for name in market_options if name not in ("initial_price", "friction_rate")]
+        # only prices, volumes and group wealth are modeled; per-run recorders, plots and snapshots are Runner features
+        unsupported += [
+            name
+            for name in (
+                "cohorts",
+                "fill_ledger",
+                "trajectory_dir",
+                "multi_resolution_history",
+                "order_flow_path",
+                "metrics",
+                "snapshots_in",
+                "snapshot_points",
+                "plot_dir",
+            )
+            if config.get(name, None) is not None
+        ]
+        if len(unsupported) > 0:
+            raise ValueError(f"VectorizedEnsemble does not support {', '.join(unsupported)}; use Runner instead")
+        self.with_friction = issubclass(market_cls, MarketWithFriction)
+        self.friction_rate = market_options.get("friction_rate", 0) if self.with_friction else 0
+
+        initial_agents = config.get("initial_agents", 0)
+        new_agents = config.get("new_agents", 0)
+        avg_wait_time = config.get("average_time_to_add_agents", 0.0001)
+
+        classes = []
+        activation_times = []
+        for agent_key in agent_key_to_class:
+            agent_cls = agent_key_to_class[agent_key]
+            agent_count = int(initial_agents * config.get(agent_key, 0))
+            classes += [agent_cls] * agent_count
+            activation_times.append(np.zeros((replicas, agent_count)))
+
+            agent_count = int(new_agents * config.get(agent_key, 0))
+            classes += [agent_cls] * agent_count
+            activation_times.append(self._draw(lambda rng: rng.exponential(1 / avg_wait_time, size=agent_count)))
+
+        self.size = len(classes)
+        self.activation_time = np.concatenate(activation_times, axis=1)
+        self.groups = list(dict.fromkeys([agent_cls.GROUP for agent_cls in classes]))
+        self.group = np.array([self.groups.index(agent_cls.GROUP) for agent_cls in classes], dtype=np.int64)
+        self.masks = {agent_cls: np.array([item is agent_cls for item in classes], dtype=bool) for agent_cls in set(classes)}
+
+        self.initialize_agents(config.get("agents-config", {}))
+
+        self.long_term_buying = np.ones((replicas, self.size), dtype=bool)
+        self.last_type = np.full((replicas, self.size), SKIP, dtype=np.int8)
+        self.last_bid = np.zeros((replicas, self.size))
+        self.welfare_keys = np.zeros((replicas, self.size))
+
+        self.tick = 0
+        self.history = {name: [] for name in ("price", "volume", "sell_action_count", "buy_action_count", "market_profit", "wealth")}
+
+    def _draw(self, draw):
+        return np.stack([draw(rng) for rng in self.rngs])
+
+    def _mask(self, agent_cls):
+        return self.masks.get(agent_cls, np.zeros(self.size, dtype=bool))
+
+    def initialize_agents(self, agents_config):
+        n = self.size
+
+        self.confidence_level = np.clip(self._draw(lambda rng: rng.normal(0.5, 0.5 / 3, size=n)), 0.1, 0.9)
+        self.ng_std = (1 - self.confidence_level) / 6
+
+        production_avg = agents_config.get("production-average", 1000)
+        production_std = agents_config.get("production-std", 200)
+        producers_count = agents_config.get("producers-percentage", 20)
+        production = self._draw(lambda rng: rng.normal(production_avg, production_std, size=n))
+        is_producer = self._draw(lambda rng: rng.uniform(0, 100, size=n)) <= producers_count
+        self.production = np.where((production < 0) | ~is_producer, 0, production)
+
+        income_alpha = agents_config.get("income-alpha", 4)
+        income_beta = agents_config.get("income-beta", 1500)
+        self.income = self._draw(lambda rng: rng.gamma(income_alpha, income_beta, size=n))
+
+        self.inventory = np.full((self.replicas, n), float(agents_config.get("initial-inventory", 0)))
+        self.cash = np.full((self.replicas, n), float(agents_config.get("initial-cash", 0)))
+
+    def run(self, ticks):
+        for tick in tqdm(range(self.tick, self.tick + ticks)):
+            self.tick = tick + 1
+            self.run_iteration(tick)
+
+    def run_iteration(self, tick):
+        active = self.activation_time <= tick
+        self.cash += self.income * active
+        self.inventory += self.production * active
+
+        # last tick's actions, for copycats whose prophet has not acted yet this tick
+        previous_type, previous_bid = self.last_type.copy(), self.last_bid.copy()
+
+        order_type, bid = self.decide(active)
+        amount = self.size_orders(order_type, bid, ~self._mask(CopyCatAgent))
+        self.copy_best_agents(order_type, bid, amount, active, previous_type, previous_bid)
+
+        self.clear(order_type, bid, amount, active)
+
+    def _ewma(self, data, alpha):
+        # same recursion as TechnicalAnalystAgent.ewma_vectorized, started from the first value
+        value = data[..., 0]
+        for i in range(data.shape[-1]):
+            value = (1 - alpha) * value + alpha * data[..., i]
+        return value
+
+    def decide(self, active):
+        shape = (self.replicas, self.size)
+        indicator = self._draw(lambda rng: rng.uniform(size=self.size))
+        bid_draw = self._draw(lambda rng: rng.uniform(size=self.size))
+        order_type = np.full(shape, SKIP, dtype=np.int8)
+
+        has_history = len(self.history["price"]) > 0
+        if has_history:
+            prices = np.stack(self.history["price"][-HISTORY_LENGTH:], axis=1)
+            noise = self._draw(lambda rng: rng.standard_normal(size=(self.size, prices.shape[1])))
+            perceived = (1 + self.ng_std[..., None] * noise) * prices[:, None, :]
+            last = perceived[..., -1]
+
+            # Random and Verification agents bid around the last price, bounded by the window's range
+            mu = last
+            std = np.maximum(np.minimum(mu - perceived.min(axis=-1), perceived.max(axis=-1) - mu) / 3, 0)
+            spread_bid = mu + std * self._draw(lambda rng: rng.standard_normal(size=self.size))
+
+            buy_count = self.history["buy_action_count"][-1]
+            sell_count = self.history["sell_action_count"][-1]
+            flow = ((buy_count - sell_count) / np.maximum(buy_count + sell_count, 1))[:, None]
+            macd = self._ewma(perceived, 2 / (12 + 1)) - self._ewma(perceived, 2 / (26 + 1))
+        else:
+            last = 100 + 200 * bid_draw
+            spread_bid = last
+            flow = 4 * indicator - 2
+            macd = 2 * indicator - 1
+
+        bid = np.broadcast_to(last, shape).copy()
+
+        mask = self._mask(FundamentalistAgent)
+        choice = np.where(3 * indicator > 2, BUY, np.where(3 * indicator > 1, SKIP, SELL))
+        order_type[:, mask] = choice[:, mask]
+
+        mask = self._mask(ContrarianAgent)
+        choice = np.where(flow > ContrarianAgent.EPS, SELL, np.where(flow < -ContrarianAgent.EPS, BUY, SKIP))
+        order_type[:, mask] = np.broadcast_to(choice, shape)[:, mask]
+
+        mask = self._mask(TechnicalAnalystAgent)
+        choice = np.where(macd > TechnicalAnalystAgent.EPS, BUY, np.where(macd < -TechnicalAnalystAgent.EPS, SELL, SKIP))
+        order_type[:, mask] = choice[:, mask]
+
+        mask = self._mask(RandomAgent)
+        choice = np.where(3 * indicator > 2, SELL, np.where(3 * indicator > 1, BUY, SKIP))
+        order_type[:, mask] = choice[:, mask]
+        bid[:, mask] = spread_bid[:, mask]
+
+        mask = self._mask(VerificationAgent)
+        choice = np.where(1 + 2 * indicator > 2, SELL, BUY)
+        order_type[:, mask] = choice[:, mask]
+        if has_history:
+            bid[:, mask] = spread_bid[:, mask]
+        else:
+            reference = self.cash / np.where(self.inventory == 0, np.nan, self.inventory)
+            bid[:, mask] = (reference * (1 + 2 * bid_draw))[:, mask]
+
+        mask = self._mask(LongTermBuyerAgent)
+        should_sell = self.long_term_buying & (1000 * indicator < 1) & mask & active
+        choice = np.where(self.long_term_buying, np.where(should_sell, SELL, BUY), SKIP)
+        order_type[:, mask] = choice[:, mask]
+        self.long_term_buying &= ~should_sell
+
+        order_type[~active] = SKIP
+        return order_type, np.nan_to_num(bid)
+
+    def _size(self, order_type, bid, confidence_level, cash, inventory):
+        # Agent.get_action's sizing, element-wise; orders that come out empty become skips
+        with np.errstate(divide="ignore", invalid="ignore"):
+            available_money = np.trunc(confidence_level * cash)
+            buy_amount = np.where((order_type == BUY) & (bid > 0), np.floor_divide(available_money, bid), 0)
+        amount = np.where(order_type == SELL, confidence_level * inventory, buy_amount)
+
+        skip = (amount <= 0) | (bid <= 0) | (order_type == SKIP)
+        return np.where(skip, SKIP, order_type), np.where(skip, 0, bid), np.where(skip, 0, amount)
+
+    def size_orders(self, order_type, bid, mask):
+        sized_type, sized_bid, amount = self._size(order_type, bid, self.confidence_level, self.cash, self.inventory)
+        order_type[:, mask] = sized_type[:, mask]
+        bid[:, mask] = sized_bid[:, mask]
+
+        self.last_type[:, mask] = order_type[:, mask]
+        self.last_bid[:, mask] = bid[:, mask]
+        return np.where(mask, amount, 0)
+
+    def _size_copied(self, order_type, bid, amount, idx):
+        sized = self._size(order_type[idx], bid[idx], self.confidence_level[idx], self.cash[idx], self.inventory[idx])
+        order_type[idx], bid[idx], amount[idx] = sized
+        self.last_type[idx] = order_type[idx]
+        self.last_bid[idx] = bid[idx]
+
+    def copy_best_agents(self, order_type, bid, amount, active, previous_type, previous_bid):
+        mask = self._mask(CopyCatAgent)
+        if not mask.any():
+            return
+
+        # best agents come from the previous tick's welfare order
+        keys = np.where(active, self.welfare_keys, np.inf)
+        best = np.argsort(keys, axis=1, kind="stable")[:, :BEST_AGENTS]
+        best_count = np.maximum(np.minimum(active.sum(axis=1), BEST_AGENTS), 1)
+
+        pick = self._draw(lambda rng: rng.uniform(size=self.size))
+        prophet_rank = (pick * best_count[:, None]).astype(np.int64)
+        prophet = np.take_along_axis(best, prophet_rank, axis=1)
+        copycat = mask[None, :] & active
+        rows = np.arange(self.replicas)
+
+        # as in Runner, the best agents act first and in rank order, so a copycat among them
+        # sees this tick's action only from prophets ranked above it and last tick's from the rest
+        for rank in range(best.shape[1]):
+            agent = best[:, rank]
+            acting = copycat[rows, agent] & (rank < best_count)
+            if not acting.any():
+                continue
+
+            idx = (rows[acting], agent[acting])
+            agent_prophet = prophet[idx]
+            ahead = prophet_rank[idx] < rank
+            order_type[idx] = np.where(ahead, self.last_type[idx[0], agent_prophet], previous_type[idx[0], agent_prophet])
+            bid[idx] = np.where(ahead, self.last_bid[idx[0], agent_prophet], previous_bid[idx[0], agent_prophet])
+            self._size_copied(order_type, bid, amount, idx)
+            copycat[idx] = False
+
+        # every other copycat acts after all of the best agents
+        order_type[copycat] = np.take_along_axis(self.last_type, prophet, axis=1)[copycat]
+        bid[copycat] = np.take_along_axis(self.last_bid, prophet, axis=1)[copycat]
+        self._size_copied(order_type, bid, amount, copycat)
+
+    def calculate_market_price(self, buy_bids, buy_amounts, sell_bids, sell_amounts):
+        if self.with_friction:
+            # MarketWithFriction's bisection, run for every replica at once
+            low = np.full(self.replicas, 0.01)
+            high = np.full(self.replicas, 1e10)
+            while np.abs(high - low).max() >= MarketWithFriction.EPS:
+                mid = (low + high) / 2
+                q_s = (sell_amounts * (sell_bids <= (mid * (1 - self.friction_rate))[:, None])).sum(axis=1)
+                q_d = (buy_amounts * (buy_bids >= mid[:, None])).sum(axis=1)
+                high = np.where(q_s >= q_d, mid, high)
+                low = np.where(q_s >= q_d, low, mid)
+            return low
+
+        # Market's equilibrium: the first ask at which supply covers the whole demand
+        total_demand = buy_amounts.sum(axis=1)
+        sell_cumulative = np.cumsum(sell_amounts, axis=1)
+        sell_count = (sell_amounts > 0).sum(axis=1)
+        idx = np.minimum((sell_cumulative < total_demand[:, None]).sum(axis=1), np.maximum(sell_count - 1, 0))
+        price = np.take_along_axis(sell_bids, idx[:, None], axis=1)[:, 0]
+        price = np.where((total_demand > 0) & (sell_count > 0), price, 0)
+        return np.maximum(1, price)
+
+    def clear(self, order_type, bid, amount, active):
+        buy = order_type == BUY
+        sell = order_type == SELL
+
+        buy_order = np.argsort(np.where(buy, -bid, np.inf), axis=1, kind="stable")
+        sell_order = np.argsort(np.where(sell, bid, np.inf), axis=1, kind="stable")
+        buy_bids = np.take_along_axis(np.where(buy, bid, -np.inf), buy_order, axis=1)
+        buy_amounts = np.take_along_axis(np.where(buy, amount, 0), buy_order, axis=1)
+        sell_bids = np.take_along_axis(np.where(sell, bid, np.inf), sell_order, axis=1)
+        sell_amounts = np.take_along_axis(np.where(sell, amount, 0), sell_order, axis=1)
+
+        market_price = self.calculate_market_price(buy_bids, buy_amounts, sell_bids, sell_amounts)
+        buyer_price = market_price
+        seller_price = market_price * (1 - self.friction_rate)
+
+        # fills in price priority up to the smaller eligible side, as in OrderBook.match
+        buy_amounts = buy_amounts * (buy_bids >= seller_price[:, None])
+        sell_amounts = sell_amounts * (sell_bids <= buyer_price[:, None])
+        total = np.minimum(buy_amounts.sum(axis=1), sell_amounts.sum(axis=1))[:, None]
+        buy_fill = np.clip(total - (np.cumsum(buy_amounts, axis=1) - buy_amounts), 0, buy_amounts)
+        sell_fill = np.clip(total - (np.cumsum(sell_amounts, axis=1) - sell_amounts), 0, sell_amounts)
+
+        bought = np.zeros_like(self.cash)
+        sold = np.zeros_like(self.cash)
+        np.put_along_axis(bought, buy_order, buy_fill, axis=1)
+        np.put_along_axis(sold, sell_order, sell_fill, axis=1)
+        self.inventory += bought - sold
+        self.cash += sold * seller_price[:, None] - bought * buyer_price[:, None]
+
+        volume = total[:, 0]
+        profit = volume * np.abs(buyer_price - seller_price)
+        self.record_history(market_price, volume, profit, buy.sum(axis=1), sell.sum(axis=1), active)
+
+    def record_history(self, market_price, volume, profit, buy_count, sell_count, active):
+        welfare = self.cash + self.inventory * market_price[:, None]
+
+        group_count = len(self.groups)
+        idx = self.group[None, :] + group_count * np.arange(self.replicas)[:, None]
+        wealth = np.bincount(idx.ravel(), weights=(welfare * active).ravel(), minlength=group_count * self.replicas)
+
+        copycat = np.array([group == CopyCatAgent.GROUP for group in self.groups])[self.group]
+        self.welfare_keys = (self.cash - market_price[:, None] * self.inventory) * ~copycat
+
+        self.history["price"].append(market_price)
+        self.history["volume"].append(volume)
+        self.history["market_profit"].append(profit)
+        self.history["buy_action_count"].append(buy_count)
+        self.history["sell_action_count"].append(sell_count)
+        self.history["wealth"].append(wealth.reshape(self.replicas, group_count))
+
+    def get_series(self, name):
+        # (replicas, ticks), or (replicas, ticks, groups) for wealth
+        return np.stack(self.history[name], axis=1)
+
+    def summaries(self, label=None):
+        prices = self.get_series("price")
+        wealth = self.get_series("wealth")
+        profits = self.get_series("market_profit").sum(axis=1)
+
+        summaries = []
+        for r in range(self.replicas):
+            steady_ticks, steady_prices = get_steady_state(prices[r])
+            summaries.append(
+                RunSummary(
+                    prices=prices[r],
+                    steady_start=steady_ticks[0],
+                    trendline=get_trendline(steady_ticks, steady_prices),
+                    wealth={group: wealth[r, :, i] for i, group in enumerate(self.groups)},
+                    market_profit=profits[r],
+                    label=label,
+                )
+            )
+        return summaries
@@ -1,28 +1,44 @@
 import math
+import time
 from pathlib import Path
 
 import dill
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from miyanmaayeh.ensemble import run_forks, summarize_run
 from miyanmaayeh.market import Market, MarketWithFriction
+from miyanmaayeh.metrics import RunMetrics
+from miyanmaayeh.results import ResultsStore
 from miyanmaayeh.runner import Runner
+from miyanmaayeh.sweep import AdaptiveSweep, GoldenSectionSearch
 
 RUNS = 5
+MAX_RUNS = 20
+TARGET_CI_WIDTH = 0.1  # relative to the mean profit
+BUDGET_FACTOR = 2  # the adaptive sweep runs at most this many times the RUNS-per-point runs of a fixed sweep
+SEED = 1000
 FRICTION_STEPS = 0.0005
+RUN_TIME = 400
+BURN_IN_TICKS = 0  # > 0 shares one frictionless burn-in per replica across all friction rates
+SEARCH = False  # search for the profit-maximizing friction rate instead of scanning the grid
 
 PLOT_DIR = "reports/"
 Path(PLOT_DIR).mkdir(parents=True, exist_ok=True)
 
+METRICS_PORT = None  # serve live metrics on http://127.0.0.1:<port>/metrics
+metrics = RunMetrics(path=PLOT_DIR + "metrics.prom", port=METRICS_PORT)
 
-results = {}
+# one id per invocation; earlier sweeps stay in the store for cross-sweep queries
+SWEEP_ID = f"friction-rate-{time.strftime('%Y%m%dT%H%M%S')}"
+results = ResultsStore(PLOT_DIR + "results.sqlite")
 
 
-def execute(num, friction_rate):
-    run_time = 400
+def get_config(friction_rate, num):
+    run_time = RUN_TIME
     steps = math.ceil(run_time / 5)
 
-    config = {
+    return {
         "snapshots_in": [i for i in range(0, run_time - 1, steps)] + [run_time - 1],
         "plot_dir": f"./reports/plots_{friction_rate:.5f}_{num}/",
         "initial_agents": 25,
@@ -48,22 +64,85 @@ def execute(num, friction_rate):
         "market-options": {
             "friction_rate": friction_rate,
         },
+        "metrics": metrics,
     }
 
-    runner = Runner(config=config)
-    runner.run(run_time)
 
-    persist_f_name = config["plot_dir"] + "runner.dill"
+def store_summary(friction_rate, num, seed, summary):
+    # the live metrics sink is process state, not part of the run's configuration
+    config = get_config(friction_rate, num)
+    config.pop("metrics")
+    config["seed"] = seed
+    if BURN_IN_TICKS > 0:
+        config["burn_in_ticks"] = BURN_IN_TICKS
+    results.add_summary(config, summary, sweep=SWEEP_ID, seed=seed)
+
+
+def store_run(friction_rate, num, runner):
+    store_summary(friction_rate, num, runner.seed, summarize_run(runner))
+
+
+def persist_run(friction_rate, num, runner):
+    persist_f_name = runner.plot_dir + "runner.dill"
     with open(persist_f_name, "wb") as f:
         dill.dump(runner, f)
 
     runner.generate_plot()
-
-    result = sum([item.market_profit for item in runner.history])
-    if friction_rate not in results:
-        results[friction_rate] = []
-
-    results[friction_rate].append(result)
+    store_run(friction_rate, num, runner)
+
+
+def warm_start_sweep(frs):
+    profits = {fr: [] for fr in frs}
+
+    for r in range(RUNS):
+        config = get_config(0, r)
+        config["plot_dir"] = None
+        config["seed"] = SEED + r
+
+        runner = Runner(config=config)
+        runner.run(BURN_IN_TICKS)
+        snapshot = runner.snapshot()
+        del runner
+
+        # no sampler or server thread may be running when the process forks; branches report their ticks on return
+        metrics.stop()
+        summaries = run_forks(snapshot, [{"friction_rate": fr} for fr in frs], RUN_TIME - BURN_IN_TICKS)
+        metrics.start()
+        metrics.record_ticks(len(frs) * (RUN_TIME - BURN_IN_TICKS))
+        for fr, summary in zip(frs, summaries):
+            store_summary(fr, r, SEED + r, summary)
+            profits[fr].append(summary.market_profit)
+
+    return {fr: sum(profits[fr]) / len(profits[fr]) for fr in frs}
+
+
+def adaptive_sweep(frs):
+    sweep = AdaptiveSweep(
+        build_config=get_config,
+        ticks=RUN_TIME,
+        target_width=TARGET_CI_WIDTH,
+        relative=True,
+        min_replicas=RUNS,
+        max_replicas=MAX_RUNS,
+        seed=SEED,
+        on_run=persist_run,
+    )
+    stats = sweep.run(frs, budget=len(frs) * RUNS * BUDGET_FACTOR)
+    return {fr: stats[fr].mean for fr in frs}
+
+
+def search_friction_rate():
+    search = GoldenSectionSearch(
+        build_config=get_config,
+        ticks=RUN_TIME,
+        min_replicas=RUNS,
+        max_replicas=MAX_RUNS,
+        seed=SEED,
+        on_run=store_run,
+    )
+    result = search.search(0, 0.04, tolerance=FRICTION_STEPS)
+    print(f"Best friction rate ~ {result.estimate:.5f} (best explored {result.best_point:.5f}, profit {result.best_mean:.2f})")
+    return [(point, mean) for point, mean, _, _ in result.explored]
 
 
 def generate_plot(points):
@@ -80,18 +159,20 @@ def generate_plot(points):
 
 def main():
     frs = [fr * FRICTION_STEPS for fr in range(int(0.04 / FRICTION_STEPS))]
+    metrics.start()
 
-    for fr in frs:
-        for r in range(RUNS):
-            execute(r, fr)
-
-    points = []
-
-    for fr in frs:
-        avg = sum(results[fr]) / len(results[fr])
-        points.append((fr, avg))
+    if SEARCH:
+        search_friction_rate()
+    elif BURN_IN_TICKS > 0:
+        warm_start_sweep(frs)
+    else:
+        adaptive_sweep(frs)
 
+    # every run of this invocation is in the results store under SWEEP_ID
+    points = [(fr, profit) for fr, profit, _ in results.aggregate("market-options.friction_rate", "market_profit", sweep=SWEEP_ID)]
     generate_plot(points)
+    metrics.stop()
+    results.close()
 
 
 if __name__ == "__main__":
@@ -1,43 +1,39 @@
 import math
-from copy import deepcopy
 from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
 
-from miyanmaayeh.runner import Runner
-from miyanmaayeh.utils import get_steady_state
+from miyanmaayeh.ensemble import EnsembleRunner
+from miyanmaayeh.vectorized import VectorizedEnsemble
 
 PLOT_DIR = "verification/"
 Path(PLOT_DIR).mkdir(parents=True, exist_ok=True)
 
 NUM_RUNS = 5
 ITERS = 500
+VECTORIZED = False  # throughput mode: run the replicas on VectorizedEnsemble instead of Runner and the agent classes
 
 
-def generate_plots(runners):
+def generate_plots(summaries):
     sns.set_theme()
     plt.figure("Verification")
 
     width = NUM_RUNS
-    height = int(math.floor(float(len(runners)) / float(width)))
+    height = int(math.floor(float(len(summaries)) / float(width)))
     fig, ax = plt.subplots(height, width, figsize=(45, 25))
     fig.suptitle("Market Prices", fontsize=54)
 
-    for i, item in enumerate(runners):
-        config, runner = item[0], item[1]
-
+    for i, summary in enumerate(summaries):
         plot_x = int(i // width)
         plot_y = int(i % width)
 
-        prices = [item.price for item in runner.history]
-        ticks = np.arange(0, len(prices))
-
-        steady_ticks, steady_prices = get_steady_state(prices)
+        prices = summary.prices
+        ticks = summary.ticks
 
-        z = np.polyfit(steady_ticks, steady_prices, 1)
-        trendline_func = np.poly1d(z)
+        steady_ticks = summary.steady_ticks
+        trendline_func = summary.trendline
         trendline = [trendline_func(tick) for tick in steady_ticks]
 
         ax[plot_x, plot_y].plot(ticks, prices, label="Market Price")
@@ -48,10 +44,7 @@ def generate_plots(runners):
             color="green",
         )
         ax[plot_x, plot_y].legend(loc="upper right", fontsize=14)
-        ax[plot_x, plot_y].set_title(
-            f"Cash={config['agents-config']['initial-cash']}, INV={config['agents-config']['initial-inventory']} - {i % NUM_RUNS + 1}",
-            fontsize=24,
-        )
+        ax[plot_x, plot_y].set_title(f"{summary.label} - {i % NUM_RUNS + 1}", fontsize=24)
         ax[plot_x, plot_y].set_xlabel("Time", fontsize=16)
         ax[plot_x, plot_y].set_ylabel("Price", fontsize=16)
 
@@ -59,6 +52,20 @@ def generate_plots(runners):
     plt.close("Verification")
 
 
+def get_label(config):
+    return f"Cash={config['agents-config']['initial-cash']}, INV={config['agents-config']['initial-inventory']}"
+
+
+def run_ensemble(config):
+    if VECTORIZED:
+        # supply/demand snapshots are a Runner feature and are not drawn here
+        ensemble = VectorizedEnsemble({key: value for key, value in config.items() if key != "snapshots_in"}, replicas=NUM_RUNS)
+        ensemble.run(ITERS)
+        return ensemble.summaries(label=get_label(config))
+
+    return EnsembleRunner(ticks=ITERS).run(config, replicas=NUM_RUNS, label=get_label(config))
+
+
 def main():
     steps = math.ceil(ITERS / 1)
 
@@ -77,29 +84,16 @@ def main():
         },
     }
 
-    runners = []
-
-    for i in range(NUM_RUNS):
-        runner = Runner(config=config)
-        runner.run(ITERS)
-        runners.append((deepcopy(config), runner))
+    summaries = run_ensemble(config)
 
     config["agents-config"]["initial-cash"] *= 2
-
-    for i in range(NUM_RUNS):
-        runner = Runner(config=config.copy())
-        runner.run(ITERS)
-        runners.append((deepcopy(config), runner))
+    summaries += run_ensemble(config)
 
     config["agents-config"]["initial-cash"] /= 2
     config["agents-config"]["initial-inventory"] *= 2
+    summaries += run_ensemble(config)
 
-    for i in range(NUM_RUNS):
-        runner = Runner(config=config.copy())
-        runner.run(ITERS)
-        runners.append((deepcopy(config), runner))
-
-    generate_plots(runners)
+    generate_plots(summaries)
 
 
 if __name__ == "__main__":